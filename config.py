@@ -20,12 +20,15 @@ class Config:
 
     game_data_config = Namespace(
         pickle_file_path=f"./tmp/{filename}.pkl",
+        sqlite_file_path=f"./tmp/{filename}.sqlite",
+        version_file_path=f"./tmp/{filename}_version.txt",
         json_file_path=f"./docs/{filename}.json",
     )
 
     dump_config = Namespace(
         FONT_NAME="Sarasa Mono Slab SC",
         output_file_path=game_data_config.pickle_file_path,
+        glyph_cache_path=f"./tmp/{filename}_glyphs.pkl",
         # 名称前缀
         name_prefix=["发言人", "审判官", "大审判官", "小", "“"],
         # 名称后缀
@@ -215,8 +218,6 @@ class Config:
             "verticalbg",
             "Video",
             "withdraw",
-            # "spellsticker", 后续适配
-            # "tutorial", 后续适配
-            # "Tutorial", 后续适配
+            # "spellsticker"、"tutorial" 等需要专门处理的指令见 Parse.register_command
         ],
     )
@@ -1,3 +1,17 @@
-from .game_data import GameData
+from typing import TYPE_CHECKING
 
-__all__ = ["GameData"]
+from .version import VersionProbe
+
+if TYPE_CHECKING:
+    from .game_data import GameData
+
+__all__ = ["GameData", "VersionProbe"]
+
+
+def __getattr__(name: str):
+    # GameData 依赖 tqdm、PIL、xlsxwriter 等，仅在用到时才导入
+    if name == "GameData":
+        from .game_data import GameData
+
+        return GameData
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,132 @@
+import re
+from typing import Iterable
+
+from .tally import SpeakerTally
+
+
+class AliasIndex:
+    """由名称前缀、后缀、排除名称与合并名称编译得到的说话人别名索引，只编译一次
+
+    以 `bind` 按全部说话人名称建立别名表后，`resolve` 即可逐个名称查找合并后的名称，
+    不依赖 `Dump`，亦可用于统计结果中的说话人（如 `CountFacts.speakers`）。
+    """
+
+    __split_pattern = re.compile(r"&|\uFF06|/")
+
+    def __init__(
+        self,
+        name_prefix: Iterable[str],
+        name_suffix: Iterable[str],
+        erase_names: Iterable[str],
+        merge_names: Iterable[Iterable[str]],
+    ):
+        # 空前缀、后缀即不添加前缀、后缀
+        self.__affixes = [
+            (prefix, suffix)
+            for prefix in dict.fromkeys(["", *name_prefix])
+            for suffix in dict.fromkeys(["", *name_suffix])
+        ]
+        self.__erase_names = frozenset(erase_names)
+
+        # {加上前缀、后缀的名称: 所属人物的序号}，同一名称可能属于多个人物
+        self.__persons: dict[str, list[int]] = {}
+        for person, names in enumerate(merge_names):
+            for name in names:
+                for prefix, suffix in self.__affixes:
+                    persons = self.__persons.setdefault(f"{prefix}{name}{suffix}", [])
+                    if person not in persons:
+                        persons.append(person)
+
+        # {原名称: 合并后的名称}，由 `bind` 建立
+        self.__aliases: dict[str, str] = {}
+
+    def groups(self, names: Iterable[str]) -> list[list[str]]:
+        """将名称分组，每组至少两个名称
+
+        先依次按各合并名称分组：名称为其某一名称加上一层前缀、后缀，且至少有两个名称；
+        再依次以其余的每个名称为准，将其加上一层前缀、后缀后的名称分为一组；
+        已分组的名称不再参与之后的分组；最后各组中排除名称不参与合并。
+        """
+        names = list(dict.fromkeys(names))
+        # 尚未分组的名称
+        remaining = dict.fromkeys(names)
+        groups: list[list[str]] = []
+
+        persons: dict[int, list[str]] = {}
+        for name in names:
+            for person in self.__persons.get(name, ()):
+                persons.setdefault(person, []).append(name)
+        for person in sorted(persons):
+            group = [name for name in persons[person] if name in remaining]
+            if len(group) > 1:
+                groups.append(group)
+                for name in group:
+                    del remaining[name]
+
+        for origin_name in list(remaining):
+            group = list(
+                dict.fromkeys(
+                    name
+                    for prefix, suffix in self.__affixes
+                    if (name := f"{prefix}{origin_name}{suffix}") in remaining
+                )
+            )
+            if len(group) > 1:
+                groups.append(group)
+                for name in group:
+                    del remaining[name]
+
+        groups = [
+            [name for name in group if name not in self.__erase_names]
+            for group in groups
+        ]
+        return [group for group in groups if len(group) > 1]
+
+    def bind(self, names: Iterable[str]):
+        """按全部说话人名称建立别名表"""
+        names = list(dict.fromkeys(names))
+        order = {name: i for i, name in enumerate(names)}
+        self.__aliases = {}
+        for group in self.groups(names):
+            merged_name = "/".join(
+                sorted(group, key=lambda name: (len(name.encode()), order[name]))
+            )
+            self.__aliases.update(dict.fromkeys(group, merged_name))
+
+    def resolve(self, name: str) -> str:
+        """合并后的名称，不需合并时即为原名称"""
+        return self.__aliases.get(name, name)
+
+    def merge(self, counter: dict[str, SpeakerTally]):
+        """拆分、合并台词量统计数据中的名称
+
+        Args:
+            counter (dict[str, SpeakerTally]): 台词量统计数据，原地修改
+        """
+        # 分离名称
+        for origin_name in list(counter.keys()):
+            names = re.split(self.__split_pattern, origin_name)
+            if len(names) > 1:
+                tally = counter.pop(origin_name)
+                for name in names:
+                    if name in counter:
+                        for key in counter[name]:
+                            counter[name][key] += tally[key]
+                    else:
+                        counter[name] = tally.copy()
+
+        # 合并名称
+        self.bind(counter)
+        merged: dict[str, SpeakerTally] = {}
+        # 与分组的顺序一致
+        for name, merged_name in self.__aliases.items():
+            tally = counter.pop(name)
+            merged_tally = merged.setdefault(
+                merged_name, {"words": 0, "punctuation": 0, "ellipsis": 0}
+            )
+            for key in tally:
+                merged_tally[key] += tally[key]
+        # 过滤掉 Word 与 Punctuation 为 0 的名字
+        for merged_name, tally in merged.items():
+            if sum(tally.values()) > 0:
+                counter[merged_name] = tally
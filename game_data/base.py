@@ -2,20 +2,27 @@
 from functools import wraps
 from typing import Callable
 
+from .facts import CountFacts
+
 
 class Base(object):
-    data: dict[str, dict[str, dict]] = {
-        "excel": {
-            "activity_table": {},
-            "gamedata_const": {
-                "dataVersion": "0.0.0",
+    data: dict[str, dict[str, dict]]
+
+    @staticmethod
+    def empty_data() -> dict[str, dict[str, dict]]:
+        """尚无缓存时的初始数据，每次调用都返回新的字典，各实例之间互不共享"""
+        return {
+            "excel": {
+                "activity_table": {},
+                "gamedata_const": {
+                    "dataVersion": "0.0.0",
+                },
+                "story_review_table": {},
             },
-            "story_review_table": {},
-        },
-        "story": {},
-        "count": {"info": {}, "items": {}},
-        "info": {"data": {}},
-    }
+            "story": {},
+            "count": CountFacts(),
+            "info": {"data": {}},
+        }
 
 
 class Info:
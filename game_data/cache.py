@@ -0,0 +1,282 @@
+import pickle
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Iterable, Self
+
+from .base import Base
+
+# 剧情文件清单：{相对路径: (文件大小, 修改时间, 内容哈希)}
+Manifest = dict[str, tuple[int, int, str]]
+# 解析结果：{story_key: (解析缓存键, command_count, counter_dict)}
+ParseResults = dict[str, tuple]
+
+
+class LazyDict(dict):
+    """首次访问某个键时才通过 `loader` 加载其值的字典"""
+
+    def __init__(self, loader: Callable[[str], Any]):
+        super().__init__()
+        self.__loader = loader
+
+    def __missing__(self, key: str) -> Any:
+        value = self.__loader(key)
+        self[key] = value
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class Cache(ABC):
+    """缓存后端的公共接口，可作为上下文管理器使用，退出时关闭"""
+
+    # 缓存是否已过时，需要重新更新
+    stale: bool = False
+
+    @abstractmethod
+    def load(self) -> dict[str, dict]:
+        """加载数据，可按需延迟加载各部分"""
+
+    @abstractmethod
+    def save(self, data: dict[str, dict], sections: Iterable[str]):
+        """保存数据中有变动的部分"""
+
+    @abstractmethod
+    def load_manifest(self) -> Manifest: ...
+
+    @abstractmethod
+    def save_manifest(self, manifest: Manifest): ...
+
+    @abstractmethod
+    def load_parse_results(self) -> ParseResults: ...
+
+    @abstractmethod
+    def save_parse_results(self, parse_results: ParseResults): ...
+
+    def close(self):
+        """释放缓存占用的资源"""
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PickleCache(Cache):
+    """将全部数据保存在单个 pickle 文件中，清单与解析结果另存为同前缀的 pickle 文件"""
+
+    def __init__(self, pickle_file: Path):
+        self.__pickle_file = pickle_file
+        self.__manifest_file = pickle_file.with_name(f"{pickle_file.stem}_manifest.pkl")
+        self.__parse_cache_file = pickle_file.with_name(
+            f"{pickle_file.stem}_parse_cache.pkl"
+        )
+        if not pickle_file.parent.exists():
+            pickle_file.parent.mkdir(parents=True)
+
+    def load(self) -> dict[str, dict]:
+        if not self.__pickle_file.exists():
+            return Base.empty_data()
+
+        data = pickle.loads(self.__pickle_file.read_bytes())
+        # 旧版缓存中保存的是剧情全文，须重新更新剧情
+        story = next(iter(data["story"].values()), None)
+        if story is not None and isinstance(story["txt"], str):
+            data["story"] = {}
+            self.stale = True
+        return data
+
+    def save(self, data: dict[str, dict], sections: Iterable[str]):
+        self.__pickle_file.write_bytes(pickle.dumps(data))
+
+    def load_manifest(self) -> Manifest:
+        if not self.__manifest_file.exists():
+            return {}
+        return pickle.loads(self.__manifest_file.read_bytes())
+
+    def save_manifest(self, manifest: Manifest):
+        self.__manifest_file.write_bytes(pickle.dumps(manifest))
+
+    def load_parse_results(self) -> ParseResults:
+        if not self.__parse_cache_file.exists():
+            return {}
+        return pickle.loads(self.__parse_cache_file.read_bytes())
+
+    def save_parse_results(self, parse_results: ParseResults):
+        self.__parse_cache_file.write_bytes(pickle.dumps(parse_results))
+
+
+class SqliteCache(Cache):
+    """将数据分表保存在 SQLite 数据库中
+
+    excel 数据表、剧情文件、剧情文件清单、每个剧情的解析结果与运行信息各存一张表，
+    读取时按需加载，写入时只写入有变动的部分。
+    """
+
+    __SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS excel (key TEXT PRIMARY KEY, value BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS story (
+            key TEXT PRIMARY KEY,
+            info_path TEXT,
+            info_digest TEXT,
+            txt_path TEXT,
+            txt_digest TEXT
+        );
+        CREATE TABLE IF NOT EXISTS manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            digest TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS counts (
+            key TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            value BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, sqlite_file: Path):
+        if not sqlite_file.parent.exists():
+            sqlite_file.parent.mkdir(parents=True)
+        self.__connection = sqlite3.connect(sqlite_file)
+        self.__connection.executescript(self.__SCHEMA)
+
+        self.__manifest: Manifest = {}
+        self.__parse_results: ParseResults = {}
+
+    def __load_blob(self, table: str, key: str) -> Any:
+        row = self.__connection.execute(
+            f"SELECT value FROM {table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def __load_excel(self, name: str) -> dict:
+        try:
+            return self.__load_blob("excel", name)
+        except KeyError:
+            empty_excel = Base.empty_data()["excel"]
+            if name in empty_excel:
+                return empty_excel[name]
+            raise
+
+    def __load_section(self, section: str) -> dict:
+        match section:
+            case "excel":
+                return LazyDict(self.__load_excel)
+            case "story":
+                return {
+                    key: {
+                        "info": None if info_path is None else (info_path, info_digest),
+                        "txt": None if txt_path is None else (txt_path, txt_digest),
+                    }
+                    for key, info_path, info_digest, txt_path, txt_digest in (
+                        self.__connection.execute("SELECT * FROM story ORDER BY rowid")
+                    )
+                }
+            case _:
+                try:
+                    return self.__load_blob("meta", section)
+                except KeyError:
+                    return Base.empty_data()[section]
+
+    def load(self) -> dict[str, dict]:
+        return LazyDict(self.__load_section)
+
+    def save(self, data: dict[str, dict], sections: Iterable[str]):
+        with self.__connection:
+            for section in sections:
+                match section:
+                    case "excel":
+                        # 只在更新后保存，此时 excel 中即为全部数据表，删除已不再保存的数据表
+                        names = list(dict.keys(data["excel"]))
+                        self.__connection.execute(
+                            "DELETE FROM excel WHERE key NOT IN"
+                            f" ({', '.join('?' * len(names))})",
+                            names,
+                        )
+                        # 只写入已被加载或更新过的数据表
+                        self.__connection.executemany(
+                            "INSERT OR REPLACE INTO excel VALUES (?, ?)",
+                            (
+                                (name, pickle.dumps(table))
+                                for name, table in dict.items(data["excel"])
+                            ),
+                        )
+                    case "story":
+                        self.__connection.execute("DELETE FROM story")
+                        self.__connection.executemany(
+                            "INSERT INTO story VALUES (?, ?, ?, ?, ?)",
+                            (
+                                (
+                                    key,
+                                    *(story["info"] or (None, None)),
+                                    *(story["txt"] or (None, None)),
+                                )
+                                for key, story in data["story"].items()
+                            ),
+                        )
+                    case _:
+                        self.__connection.execute(
+                            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                            (section, pickle.dumps(data[section])),
+                        )
+
+    def close(self):
+        self.__connection.close()
+
+    def load_manifest(self) -> Manifest:
+        self.__manifest = {
+            path: (size, mtime, digest)
+            for path, size, mtime, digest in self.__connection.execute(
+                "SELECT * FROM manifest"
+            )
+        }
+        return self.__manifest.copy()
+
+    def save_manifest(self, manifest: Manifest):
+        with self.__connection:
+            self.__connection.executemany(
+                "DELETE FROM manifest WHERE path = ?",
+                ((path,) for path in self.__manifest.keys() - manifest.keys()),
+            )
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?)",
+                (
+                    (path, *entry)
+                    for path, entry in manifest.items()
+                    if self.__manifest.get(path) != entry
+                ),
+            )
+        self.__manifest = manifest.copy()
+
+    def load_parse_results(self) -> ParseResults:
+        self.__parse_results = {
+            key: (digest, *pickle.loads(value))
+            for key, digest, value in self.__connection.execute("SELECT * FROM counts")
+        }
+        return self.__parse_results.copy()
+
+    def save_parse_results(self, parse_results: ParseResults):
+        with self.__connection:
+            self.__connection.executemany(
+                "DELETE FROM counts WHERE key = ?",
+                ((key,) for key in self.__parse_results.keys() - parse_results.keys()),
+            )
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?)",
+                (
+                    (key, result[0], pickle.dumps(result[1:]))
+                    for key, result in parse_results.items()
+                    if key not in self.__parse_results
+                    or self.__parse_results[key][0] != result[0]
+                ),
+            )
+        self.__parse_results = parse_results.copy()
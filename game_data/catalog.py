@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+
+@dataclass
+class StoryFiles:
+    """剧情对应的文件，路径均相对于 story 目录"""
+
+    info: str | None = None
+    txt: str | None = None
+
+
+class StoryCatalog:
+    """剧情目录
+
+    以 story_key 与文件路径索引所有剧情，并记录已被统计过的剧情，使各项查找均为 O(1)。
+    """
+
+    def __init__(self, info_dirname: str = "[uc]info"):
+        self.__info_prefix = f"{info_dirname}/"
+        self.__stories: dict[str, StoryFiles] = {}
+        self.__consumed: set[str] = set()
+
+    @classmethod
+    def from_keys(cls, story_keys: Iterable[str]) -> StoryCatalog:
+        catalog = cls()
+        for story_key in story_keys:
+            catalog.__stories[story_key] = StoryFiles()
+        return catalog
+
+    def __contains__(self, story_key: str) -> bool:
+        return story_key in self.__stories
+
+    def __getitem__(self, story_key: str) -> StoryFiles:
+        return self.__stories[story_key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__stories)
+
+    def __len__(self) -> int:
+        return len(self.__stories)
+
+    def story_key(self, path: str) -> str:
+        """由剧情文件（info 或 txt）的相对路径得到 story_key"""
+        return path.removeprefix(self.__info_prefix).removesuffix(".txt")
+
+    def add(self, path: str) -> str:
+        """添加剧情文件，按首次添加的顺序排列剧情
+
+        Args:
+            path (str): 剧情文件相对于 story 目录的路径
+
+        Returns:
+            str: 文件所属剧情的 story_key
+        """
+        story_key = self.story_key(path)
+        story_files = self.__stories.setdefault(story_key, StoryFiles())
+        if path.startswith(self.__info_prefix):
+            story_files.info = path
+        else:
+            story_files.txt = path
+        return story_key
+
+    def consume_reviews(
+        self, story_review_table: dict[str, dict]
+    ) -> list[tuple[str, dict, dict]]:
+        """列出 `story_review_table` 中的剧情，并将这些剧情标记为已统计
+
+        Returns:
+            list[tuple[str, dict, dict]]: 按表中顺序排列的 (story_id, story, infoUnlockData)
+        """
+        review_list: list[tuple[str, dict, dict]] = []
+        for story_id, story in story_review_table.items():
+            for infoUnlockData in story["infoUnlockDatas"]:
+                story_key: str = infoUnlockData["storyTxt"]
+                self.consume(story_key)
+                review_list.append((story_id, story, infoUnlockData))
+        return review_list
+
+    def consume(self, story_key: str):
+        if story_key not in self.__stories:
+            raise ValueError(f"Story `{story_key}` not found!")
+        if story_key in self.__consumed:
+            raise ValueError(f"Story `{story_key}` has already been counted!")
+        self.__consumed.add(story_key)
+
+    def remaining(self) -> list[str]:
+        """尚未被统计的剧情，保持原有顺序"""
+        return [key for key in self.__stories if key not in self.__consumed]
@@ -1,11 +1,38 @@
-import collections
-import copy
+import os
 from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from tqdm import tqdm
 
+from .cache import Cache, ParseResults
+from .catalog import StoryCatalog
+from .facts import CountFacts
 from .parse import Parse
+from .tally import SpeakerTally
+
+# 进程池中各工作进程各自的解析器
+_parser: Parse
+
+
+def _init_parser(
+    known_commands: list[str],
+    story_dir: Path,
+    args: Namespace,
+    excel: dict[str, dict],
+):
+    global _parser
+    _parser = Parse(
+        known_commands=known_commands,
+        unknown={"commands": [], "heads": []},
+        story_dir=story_dir,
+        args=args,
+    )
+    _parser.data = {"excel": excel}
+
+
+def _parse_story(story: dict) -> tuple[int, dict[str, SpeakerTally]]:
+    return _parser.parse_story(story)
 
 
 class Count(Parse):
@@ -13,16 +40,26 @@ def __init__(
         self,
         config: Namespace,
         unknown: dict[str, list[str]],
+        story_dir: Path,
+        cache: Cache,
         args: Namespace,
     ):
         Parse.__init__(
             self,
             known_commands=config.known_commands,
             unknown=unknown,
+            story_dir=story_dir,
             args=args,
         )
 
         self.__output_file = Path(config.output_file_path)
+        self.__cache = cache
+        self.__debug: bool = args.debug
+        self.__story_dir = story_dir
+        self.__args = args
+        self.__known_commands: list[str] = config.known_commands
+        # Debug 信息须在主进程中收集，此时只能串行解析
+        self.__jobs: int = 1 if args.debug else args.jobs
 
         self.__unknown_commands: list[str] = unknown["commands"]
         self.__unknown_commands_file = self.__output_file.with_name(
@@ -33,140 +70,154 @@ def __init__(
             f"{self.__output_file.stem}_unknown_heads.txt"
         )
 
-        from string import punctuation as punc_en
-
-        from zhon.hanzi import punctuation as punc_zh
-
-        self.__punctuation: set[str] = set(punc_en + punc_zh)
-
-    def __count_story(
-        self,
-        command_count: int,
-        collection_dict: dict[str, collections.Counter],
-        dict_list: list[dict],
-    ):
-        words_collection = collections.Counter()
-        punctuation_collection = collections.Counter()
-        counter_dict: dict[str, dict[str, int]] = {}
-        for name, collection in collection_dict.items():
-            counter_dict[name] = {
-                "words": 0,
-                "punctuation": 0,
-                "ellipsis": collection["…"],
-            }
-            collection_set = set(collection)
-            for i in self.__punctuation & collection_set:
-                punctuation_collection.update({i: collection[i]})
-                counter_dict[name]["punctuation"] += collection[i]
-                del collection[i]
-            counter_dict[name]["words"] += collection.total()
-            words_collection.update(collection)
-
-        count_dict: dict[str, int] = {
-            "commands": command_count,
-            "words": words_collection.total(),
-            "punctuation": punctuation_collection.total(),
-            "ellipsis": punctuation_collection["…"],
-        }
-        for dic in dict_list:
-            for key in count_dict:
-                if key not in dic:
-                    dic[key] = count_dict[key]
-                else:
-                    dic[key] += count_dict[key]
+        # 省略号是标点符号时才计入剧情的省略号数
+        self.__count_ellipsis: bool = "…" in self.punctuation
+
+    def __parse_stories(
+        self, story_keys: list[str]
+    ) -> dict[str, tuple[int, dict[str, SpeakerTally]]]:
+        """解析剧情，优先复用已缓存的解析结果
+
+        `--jobs` 大于 1 时，在多个进程中并行解析未命中缓存的剧情；
+        结果按 `story_keys` 的顺序返回，与串行解析一致。
+
+        Args:
+            story_keys (list[str]): 要解析的剧情
+
+        Returns:
+            dict[str, tuple[int, dict[str, SpeakerTally]]]: 每个剧情的解析结果
+        """
+        stories = self.data["story"]
+        parse_cache: ParseResults = {}
+        if not self.__debug:
+            parse_cache = self.__cache.load_parse_results()
+
+        fingerprint = self.parser_fingerprint()
+        digests: dict[str, str] = {}
+        results: dict[str, tuple[int, dict[str, SpeakerTally]]] = {}
+        todo: list[str] = []
+        for story_key in story_keys:
+            # Debug 模式需要收集未知的指令与说话人，不使用缓存
+            if self.__debug:
+                todo.append(story_key)
+                continue
 
-            if "counter" not in dic:
-                dic["counter"] = copy.deepcopy(counter_dict)
+            digests[story_key] = self.story_digest(stories[story_key], fingerprint)
+            cached = parse_cache.get(story_key)
+            if cached is not None and cached[0] == digests[story_key]:
+                results[story_key] = cached[1:]
             else:
-                for name in counter_dict:
-                    if name not in dic["counter"]:
-                        dic["counter"][name] = counter_dict[name].copy()
-                    else:
-                        for key in counter_dict[name]:
-                            dic["counter"][name][key] += counter_dict[name][key]
+                todo.append(story_key)
+
+        jobs = self.__jobs or os.cpu_count() or 1
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_parser,
+                initargs=(
+                    self.__known_commands,
+                    self.__story_dir,
+                    self.__args,
+                    self.parser_context(),
+                ),
+            ) as executor:
+                chunksize = max(1, len(todo) // (jobs * 4))
+                for story_key, result in zip(
+                    todo,
+                    tqdm(
+                        executor.map(
+                            _parse_story,
+                            (stories[story_key] for story_key in todo),
+                            chunksize=chunksize,
+                        ),
+                        "parsing",
+                        total=len(todo),
+                    ),
+                ):
+                    results[story_key] = result
+        else:
+            for story_key in tqdm(todo, "parsing"):
+                results[story_key] = self.parse_story(stories[story_key])
+
+        # 只保留本次用到的解析结果
+        if not self.__debug:
+            self.__cache.save_parse_results(
+                {
+                    story_key: (digests[story_key], *results[story_key])
+                    for story_key in story_keys
+                }
+            )
+
+        return results
 
     def count_words(self):
-        self.data["count"] = {"info": {}, "items": {}}
-        stories = list(self.data["story"].keys())
-        for story_id, story in tqdm(
-            self.data["excel"]["story_review_table"].items(), "story_review"
-        ):
-            name: str = story["name"]
-            entry_type = story["entryType"]
-            act_type = story["actType"]
-            for infoUnlockData in story["infoUnlockDatas"]:
-                story_code: str = infoUnlockData["storyCode"]
-                if story_code == "":
-                    # For mini story
-                    story_code = str(infoUnlockData["storySort"])
-                elif story_code is None:
-                    # For 人员密录
-                    story_code = story_id.split("_")[-1]
-                story_name: str = infoUnlockData["storyName"]
-                story_key: str = infoUnlockData["storyTxt"]
-                avg_tag: str = infoUnlockData["avgTag"]
-                stories.remove(story_key)
-                command_count, collection_dict = self.parse_story(
-                    self.data["story"][story_key]
-                )
-                if len(collection_dict) == 0:
-                    continue
-
-                entry_type_dict: dict[str, dict] = self.data["count"][
-                    "items"
-                ].setdefault(entry_type, {"info": {"name": act_type}, "items": {}})
-                story_id_dict: dict[str, dict] = entry_type_dict["items"].setdefault(
-                    story_id, {"info": {"name": name}, "items": {}}
-                )
-                story_dict: dict[str, dict] = story_id_dict["items"].setdefault(
-                    story_code, {"info": {"name": story_name.strip()}, "items": {}}
-                )
-                avg_dict: dict[str, dict] = story_dict["items"].setdefault(
-                    avg_tag, {"info": {}, "items": {}}
-                )
-                self.__count_story(
-                    command_count,
-                    collection_dict,
-                    [
-                        self.data["count"]["info"],
-                        entry_type_dict["info"],
-                        story_id_dict["info"],
-                        story_dict["info"],
-                        avg_dict["info"],
-                    ],
-                )
+        catalog = StoryCatalog.from_keys(self.data["story"])
+        review_list = catalog.consume_reviews(self.data["excel"]["story_review_table"])
 
-        basicInfo = self.data["excel"]["activity_table"]["basicInfo"]
         banned_dirname = {"guide", "tutorial", "training", "act1bossrush", "bossrush"}
         # TODO: 只统计关卡文本，不统计任务文本（如 act29side chat_）(只影响 activities，不影响 ACTIVITY)
-        for story_key in stories:
+        other_list: list[tuple[str, list[str]]] = []
+        for story_key in catalog.remaining():
             parts = story_key.split("/")
             if banned_dirname & set(parts):
                 continue
             # if parts[-1].startswith("chat_"):
             #     continue
-            command_count, collection_dict = self.parse_story(
-                self.data["story"][story_key]
+            other_list.append((story_key, parts))
+
+        results = self.__parse_stories(
+            [infoUnlockData["storyTxt"] for _, _, infoUnlockData in review_list]
+            + [story_key for story_key, _ in other_list]
+        )
+
+        facts = CountFacts(self.__count_ellipsis)
+        for story_id, story, infoUnlockData in review_list:
+            name: str = story["name"]
+            entry_type = story["entryType"]
+            act_type = story["actType"]
+            story_code: str = infoUnlockData["storyCode"]
+            if story_code == "":
+                # For mini story
+                story_code = str(infoUnlockData["storySort"])
+            elif story_code is None:
+                # For 人员密录
+                story_code = story_id.split("_")[-1]
+            story_name: str = infoUnlockData["storyName"]
+            story_key: str = infoUnlockData["storyTxt"]
+            avg_tag: str = infoUnlockData["avgTag"]
+            command_count, counter_dict = results[story_key]
+            if len(counter_dict) == 0:
+                continue
+
+            entry_type_node = facts.node(0, entry_type, {"name": act_type})
+            story_id_node = facts.node(entry_type_node, story_id, {"name": name})
+            story_node = facts.node(
+                story_id_node, story_code, {"name": story_name.strip()}
             )
-            if len(collection_dict) == 0:
+            avg_node = facts.node(story_node, avg_tag)
+            facts.add_story(avg_node, command_count, counter_dict)
+
+        basicInfo = self.data["excel"]["activity_table"]["basicInfo"]
+        for story_key, parts in other_list:
+            command_count, counter_dict = results[story_key]
+            if len(counter_dict) == 0:
                 continue
 
-            # dic = DATA["count"]["items"].setdefault("OTHERS", {"info": {}, "items": {}})
-            dic = self.data["count"]
-            dict_list = [dic["info"]]
+            # node = facts.node(0, "OTHERS")
+            node = 0
             for i in parts:
-                if i not in dic["items"]:
-                    if i in basicInfo:
-                        info = {
-                            "name": basicInfo[i]["name"],
-                            # "type": basicInfo[i]["type"],
-                        }
-                    else:
-                        info = {}
-                    dic["items"][i] = {"info": info, "items": {}}
-                dict_list.append(dic["items"][i]["info"])
-                dic = dic["items"][i]
-            self.__count_story(command_count, collection_dict, dict_list)
+                if i in basicInfo:
+                    info = {
+                        "name": basicInfo[i]["name"],
+                        # "type": basicInfo[i]["type"],
+                    }
+                else:
+                    info = {}
+                node = facts.node(node, i, info)
+            facts.add_story(node, command_count, counter_dict)
+
+        # 只记录叶子节点上各剧情的统计，统计树在导出时再由事实表汇总得到
+        self.data["count"] = facts
 
         if len(self.__unknown_commands):
             tmp_text = ""
@@ -1,15 +1,20 @@
 import datetime
-import re
 from argparse import Namespace
 from collections import Counter
-from itertools import product
 from pathlib import Path
-from typing import Any
 
+from .alias import AliasIndex
 from .base import Base, Info
 from .excel import CellFormatProperties as Props
-from .excel import Sheet
-from .utils import amend_sheet_list, find_index, find_indices, merge_sheets_list
+from .excel import Range, Sheet
+from .glyph import GlyphCache
+from .utils import (
+    BlockLayout,
+    amend_sheet_list,
+    find_index,
+    find_indices,
+    merge_sheets_list,
+)
 
 
 class Dump(Base):
@@ -17,7 +22,6 @@ class Dump(Base):
     __PUNCTUATION = "标点数"
     __ELLIPSIS = "省略号"
     __COMMANDS = "指令数"
-    __split_pattern = re.compile(r"&|\uFF06|/")
 
     def __init__(
         self,
@@ -26,10 +30,12 @@ def __init__(
     ):
         self.__FONT_NAME: str = config.FONT_NAME
         self.__output_file = Path(config.output_file_path)
-        self.__name_prefix: list[str] = config.name_prefix
-        self.__name_suffix: list[str] = config.name_suffix
-        self.__erase_names: list[str] = config.erase_names
-        self.__merge_names: list[list[str]] = config.merge_names
+        self.__alias_index = AliasIndex(
+            config.name_prefix,
+            config.name_suffix,
+            config.erase_names,
+            config.merge_names,
+        )
 
         # https://mirrors.tuna.tsinghua.edu.cn/github-release/be5invis/Sarasa-Gothic/LatestRelease/SarasaMonoSlabSC-TTF-Unhinted-1.0.13.7z
         self.__font_path: dict[str, dict[str, str]] = {
@@ -38,6 +44,12 @@ def __init__(
                 "bold": "./tmp/SarasaMonoSlabSC-Bold.ttf",
             }
         }
+        self.__glyph_cache = GlyphCache(Path(config.glyph_cache_path))
+        self.__font_props = {
+            "font_path": self.__font_path,
+            "glyph_cache": self.__glyph_cache,
+            "fast_layout": args.fast_layout,
+        }
 
         today = f"{datetime.date.today():%Y%m%d}"
         self.__xlsx_file = self.__output_file.with_name(
@@ -46,6 +58,7 @@ def __init__(
 
         self.__debug: bool = args.debug
         self.__style: bool = args.style or args.publish
+        self.__numpy: bool = args.numpy
 
     def __merge_counter_dict(self, counter: dict[str, dict]):
         """拆分、合并台词，整理台词量统计数据
@@ -53,79 +66,14 @@ def __merge_counter_dict(self, counter: dict[str, dict]):
         Args:
             counter (dict[str, dict]): 台词量统计数据
         """
-        # 分离名称
-        for origin_name in list(counter.keys()):
-            names = re.split(self.__split_pattern, origin_name)
-            if len(names) > 1:
-                for name in names:
-                    if name in counter:
-                        for key in counter[name]:
-                            counter[name][key] += counter[origin_name][key]
-                    else:
-                        counter[name] = counter[origin_name]
-                del counter[origin_name]
-
-        origin_names = list(counter.keys())
-        merged_names: list[list[str]] = []
-        self.__name_prefix.append("")
-        self.__name_suffix.append("")
-        name_prefixes = set(self.__name_prefix)
-        name_suffixes = set(self.__name_suffix)
-
-        # 扩增并过滤单个名称
-        for person in self.__merge_names:
-            names = set()
-            for name in person:
-                for i in product(name_prefixes, [name], name_suffixes):
-                    new_name = "".join(i)
-                    if new_name in origin_names:
-                        names.add(new_name)
-            if len(names) > 1:
-                merged_names.append(list(names))
-                for new_name in names:
-                    origin_names.remove(new_name)
-
-        # 扩增名称
-        for origin_name in origin_names[:]:
-            # TODO: ❌❌的⭕⭕ -> (❌❌|❌❌)的⭕⭕ or '\n'.join(['❌❌的⭕⭕',...])
-            if self.__debug and "的" in origin_name:
-                p, s = origin_name.split(sep="的", maxsplit=1)
-                print("(suf|pre)fix:", s, p, origin_name)
-
-            names = []
-            for i in product(name_prefixes, [origin_name], name_suffixes):
-                new_name = "".join(i)
-                if new_name in origin_names:
-                    names.append(new_name)
-            if len(names) > 1:
-                merged_names.append(names)
-                for new_name in names:
-                    origin_names.remove(new_name)
-
-        # 排除名称
-        for names in merged_names[:]:
-            for name in names[:]:
-                if name in self.__erase_names:
-                    names.remove(name)
-            if len(names) == 1:
-                merged_names.remove(names)
-
-        # 合并名称
-        counter_dict: dict[str, dict[str, int]] = {}
-        for names in merged_names:
-            merged_name = "/".join(sorted(names, key=lambda name: len(name.encode())))
-            counter_dict[merged_name] = {
-                "words": 0,
-                "punctuation": 0,
-                "ellipsis": 0,
-            }
-            for name in names:
-                for key in counter[name]:
-                    counter_dict[merged_name][key] += counter[name][key]
-                del counter[name]
-            # 过滤掉 Word 与 Punctuation 为 0 的名字
-            if sum(counter_dict[merged_name].values()) > 0:
-                counter[merged_name] = counter_dict[merged_name]
+        if self.__debug:
+            for origin_name in counter:
+                # TODO: ❌❌的⭕⭕ -> (❌❌|❌❌)的⭕⭕ or '\n'.join(['❌❌的⭕⭕',...])
+                if "的" in origin_name:
+                    p, s = origin_name.split(sep="的", maxsplit=1)
+                    print("(suf|pre)fix:", s, p, origin_name)
+
+        self.__alias_index.merge(counter)
 
     def __gen_sorted_counter_data(
         self,
@@ -307,7 +255,7 @@ def append_list(index: str | None, info_dict: dict):
 
     def __gen_detail_data(
         self,
-        sheet_detail_list: list[list[Any]],
+        sheet_detail: BlockLayout,
         data_dict: dict[str, dict[str, dict[str, dict]]],
     ):
         """生成每个表单上的所有数据"""
@@ -332,19 +280,20 @@ def gen_story(tab_time: int, data: dict[str, dict[str, dict]]):
                 gen_story(tab_time + 1, data["items"][key])
 
         # 生成 info data
-        self.__gen_info_data(0, data_dict["info"], sheet_detail_list)
+        info_list = []
+        self.__gen_info_data(0, data_dict["info"], info_list)
+        sheet_detail.add_below(info_list)
 
         stories = data_dict["items"]
         for story_name in stories:
-            levels_list = []
+            # 各关卡依次向右排列
+            story_levels = BlockLayout()
             for level_name in stories[story_name]["items"]:
                 level_list = [[level_name]]
                 gen_story(1, stories[story_name]["items"][level_name])
-                amend_sheet_list(level_list)
-                levels_list.append(level_list)
+                story_levels.add_right(level_list)
 
-            story_list = merge_sheets_list(levels_list, False)
-            sheet_detail_list.append([])  # 空一行
+            sheet_detail.add_below([[]])  # 空一行
 
             story_digest = [[story_name]]
 
@@ -354,29 +303,33 @@ def gen_story(tab_time: int, data: dict[str, dict[str, dict]]):
                     1,
                     stories[story_name]["info"],
                     story_digest,
-                    max_number=len(story_list) - 1,
+                    max_number=story_levels.height - 1,
                 )
-                amend_sheet_list(story_digest)
 
-            sheet_detail_list.extend(
-                merge_sheets_list([story_digest, story_list], False)
-            )
+            story_layout = BlockLayout()
+            story_layout.add_right(story_digest)
+            story_layout.add_right(story_levels)
+            sheet_detail.add_below(story_layout)
 
     @Info("gen overview sheet style...")
     def __gen_overview_sheet_style(self, overview: Sheet):
         overview.default_format_properties.update(
             {"font_name": self.__FONT_NAME, "font_size": 14}
         )
-        overview.other_props.update({"font_path": self.__font_path})
+        overview.other_props.update(self.__font_props)
+
+        # 各 Index 右侧的列，循环结束后一并设置格式（不影响循环中的 autofit 与 merge）
+        name_columns: list[Range] = []
+        ellipsis_columns: list[Range] = []
 
         for row, row_data in enumerate(overview.cells):
             for idx_column in find_indices(row_data, "Index"):
                 overview[row, idx_column].expand().autofit()
 
                 # Name column: Horizontal Alignment Center
-                overview[:, idx_column + 1].set_format(Props.center)
+                name_columns.append(overview[:, idx_column + 1])
                 # “省略号”列
-                overview[:, idx_column + 4].set_format({"num_format": "(0)"})
+                ellipsis_columns.append(overview[:, idx_column + 4])
 
                 # Index region: Border Line Style
                 overview[row, idx_column].expand().set_format(Props.border)
@@ -403,6 +356,9 @@ def __gen_overview_sheet_style(self, overview: Sheet):
 
                 overview[:, bold_column].set_format(Props.font_bold)
 
+        overview.set_formats(name_columns, Props.center)
+        overview.set_formats(ellipsis_columns, {"num_format": "(0)"})
+
         # First column: Horizontal Alignment Right
         overview[:, 0].set_format(Props.right)
 
@@ -435,7 +391,7 @@ def __gen_sheet_style(self, overview: Sheet, simple: Sheet, counter: Sheet):
         # 『总览』表单
         # The default font_size is 11
         simple.default_format_properties.update({"font_name": self.__FONT_NAME})
-        simple.other_props.update({"font_path": self.__font_path})
+        simple.other_props.update(self.__font_props)
         simple.autofit()
 
         for row, row_data in enumerate(simple.cells):
@@ -457,7 +413,7 @@ def __gen_sheet_style(self, overview: Sheet, simple: Sheet, counter: Sheet):
         counter.default_format_properties.update(
             {"font_name": self.__FONT_NAME, "font_size": 14}
         )
-        counter.other_props.update({"font_path": self.__font_path})
+        counter.other_props.update(self.__font_props)
         counter[1:, :].autofit()
 
         idx_row = 1
@@ -519,19 +475,24 @@ def __write_excel_data(
 
             if self.__style:
                 self.__gen_sheet_style(overview, simple, counter)
+                self.__glyph_cache.save()
 
             # 将数据写回到表单
             overview.write()
             simple.write()
             counter.write()
-            for key in sheets_detail_dict:
-                Sheet(workbook=workbook, name=key, data=sheets_detail_dict[key]).write()
+            # 详情表单没有格式，直接写入各个非空单元格
+            for key, sheet_detail in sheets_detail_dict.items():
+                worksheet = workbook.add_worksheet(key)
+                for row, col, data in sheet_detail.cells():
+                    worksheet.write(row, col, data)
 
             overview.worksheet.activate()
 
     @Info("Generating data...")
     def __gen_excel_data(
         self,
+        count: dict[str, dict],
         sheets_overview_list: list,
         sheets_simple_list: list,
         sheets_detail_dict: dict,
@@ -539,7 +500,7 @@ def __gen_excel_data(
     ):
         storys_overview_dict = {"items": {}}
 
-        for entry_type, item_dict in self.data["count"]["items"].items():
+        for entry_type, item_dict in count["items"].items():
             # 『概观』表单
             sheet_overview_list = [[entry_type]]
             self.__gen_overview_data(sheet_overview_list, item_dict, "words")
@@ -552,10 +513,10 @@ def __gen_excel_data(
             amend_sheet_list(sheet_simple_list)
             sheets_simple_list.append(sheet_simple_list)
 
-            sheet_detail_list = [[entry_type]]
-            self.__gen_detail_data(sheet_detail_list, item_dict)
-            amend_sheet_list(sheet_detail_list)
-            sheets_detail_dict[entry_type] = sheet_detail_list
+            sheet_detail = BlockLayout()
+            sheet_detail.add_below([[entry_type]])
+            self.__gen_detail_data(sheet_detail, item_dict)
+            sheets_detail_dict[entry_type] = sheet_detail
 
             for story_key, story_dict in item_dict["items"].items():
                 if story_key in storys_overview_dict["items"]:
@@ -573,7 +534,7 @@ def __gen_excel_data(
         # 『台词』表单
         sheet_counter_list.append(["台词量统计"])
         self.__gen_sorted_counter_data(
-            0, self.data["count"]["info"], sheet_counter_list, None, False, True
+            0, count["info"], sheet_counter_list, None, False, True
         )
         amend_sheet_list(sheet_counter_list)
 
@@ -583,20 +544,24 @@ def dump_excel(self) -> Path:
         sheet_counter_list = []
         sheets_detail_dict = {}
 
+        # 由事实表汇总得到统计树
+        count = self.data["count"].tree(self.__numpy)
+
         # 初始化台词量统计数据
-        self.__merge_counter_dict(self.data["count"]["info"]["counter"])
+        self.__merge_counter_dict(count["info"]["counter"])
 
         sheet_overview_list = []
         # 添加文档首部信息
         self.__add_info_data(sheet_overview_list)
         # 添加总量统计信息
         sheet_overview_list.append(["ALL"])
-        self.__gen_info_data(0, self.data["count"]["info"], sheet_overview_list, 13)
+        self.__gen_info_data(0, count["info"], sheet_overview_list, 13)
         amend_sheet_list(sheet_overview_list)
         sheets_overview_list.append(sheet_overview_list)
 
         # 生成 Excel 表单数据
         self.__gen_excel_data(
+            count,
             sheets_overview_list,
             sheets_simple_list,
             sheets_detail_dict,
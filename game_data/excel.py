@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+from bisect import bisect_right
 from dataclasses import dataclass
 from enum import StrEnum
 from logging import warn
-from typing import Any, Optional, SupportsIndex
+from typing import Any, Iterable, NamedTuple, Optional
+from weakref import WeakKeyDictionary
 
 from PIL import ImageFont
 from xlsxwriter import Workbook
 from xlsxwriter.format import Format
 
+from .glyph import EstimatedFont, GlyphCache
 from .utils import Axis, check_index
 
+# 测量文本尺寸所用的字体
+Font = ImageFont.FreeTypeFont | EstimatedFont
+
+# Workbook 级的格式缓存：{冻结的格式属性: Format}，相同的格式只创建一次
+_format_cache: WeakKeyDictionary[Workbook, dict[frozenset, Format]] = (
+    WeakKeyDictionary()
+)
+
 
 class ExpandType(StrEnum):
     DOWN = "down"
@@ -39,20 +50,20 @@ class CellFormatProperties:
     title = {**center, "border": 2}
 
 
-@dataclass(frozen=True)
-class Index:
+# 坐标均为元组，构造与比较都很轻量
+
+
+class Index(NamedTuple):
     row: int
     col: int
 
 
-@dataclass(frozen=True)
-class RangeIndex:
+class RangeIndex(NamedTuple):
     first: Index
     last: Index
 
 
-@dataclass(frozen=True)
-class RangeSlice:
+class RangeSlice(NamedTuple):
     row: slice
     col: slice
 
@@ -83,9 +94,83 @@ def parse_index(ind: int | slice, rng: Axis) -> Axis:
     return RangeIndex(Index(row.left, col.left), Index(row.right, col.right))
 
 
+class Runs:
+    """一行或一列中连续非空单元格的区间（闭区间 `[start, end]`），以二分查找定位"""
+
+    def __init__(self, occupied: list[bool]):
+        self.length = len(occupied)
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        for position, is_occupied in enumerate(occupied):
+            if not is_occupied:
+                continue
+            if self.ends and self.ends[-1] == position - 1:
+                self.ends[-1] = position
+            else:
+                self.starts.append(position)
+                self.ends.append(position)
+
+    def run(self, position: int) -> tuple[int, int] | None:
+        """包含该位置的区间，该位置为空时为 None"""
+        i = bisect_right(self.starts, position) - 1
+        if i >= 0 and position <= self.ends[i]:
+            return self.starts[i], self.ends[i]
+        return None
+
+    def next_occupied(self, position: int, step: int) -> int | None:
+        """自该位置起（含）沿 `step` 方向的第一个非空位置"""
+        if not 0 <= position < self.length:
+            return None
+        i = bisect_right(self.starts, position) - 1
+        if step < 0:
+            return min(position, self.ends[i]) if i >= 0 else None
+        if i >= 0 and position <= self.ends[i]:
+            return position
+        return self.starts[i + 1] if i + 1 < len(self.starts) else None
+
+    def end(
+        self, position: int, step: int, time: int, stop_when_still: bool = False
+    ) -> int:
+        """自该位置沿 `step` 方向交替跳到区间的末端与下一区间的起点，共 `time` 次
+
+        Args:
+            stop_when_still (bool, optional): 某次未移动时即停止. Defaults to False.
+        """
+        # 下一个待检查的位置
+        cursor = position + step
+        next_position = position
+        is_start_blank = self.run(position) is None
+        for i in range(time):
+            last_position = next_position
+            if (i + is_start_blank) % 2 == 0:
+                # 跳到区间的末端，并越过其后的空单元格
+                if 0 <= cursor < self.length:
+                    run = self.run(cursor)
+                    if run is not None:
+                        next_position = run[1] if step > 0 else run[0]
+                        cursor = next_position + step
+                    if 0 <= cursor < self.length:
+                        cursor += step
+            else:
+                # 跳到下一个非空单元格
+                found = self.next_occupied(cursor, step)
+                if found is None:
+                    cursor = self.length if step > 0 else -1
+                else:
+                    next_position = found
+                    cursor = found + step
+
+            if stop_when_still and last_position == next_position:
+                break
+
+        return next_position
+
+
 class Range:
     """Rectangle range"""
 
+    __slots__ = ("sheet", "__index", "__active_cell")
+
     def __init__(
         self,
         sheet: Sheet,
@@ -93,22 +178,13 @@ def __init__(
     ):
         self.sheet = sheet
 
-        self.__breadth = len(self.sheet.cells[0])
-        self.__depth = len(self.sheet.cells)
         # 未作合法性检验
-        self.__index = index or RangeIndex(
-            first=Index(row=0, col=0),
-            last=Index(row=self.__depth - 1, col=self.__breadth - 1),
-        )
-        self.__range = RangeSlice(
-            row=slice(self.__index.first.row, self.__index.last.row + 1),
-            col=slice(self.__index.first.col, self.__index.last.col + 1),
-        )
+        self.__index = index or sheet.full_index
         self.__active_cell = self.__index.first
 
     def __getitem__(self, index_tuple: tuple[int | slice, int | slice]) -> Range:
         index_range = (
-            self.sheet.__index
+            self.sheet.full_index
             if self.__index.first == self.__index.last
             else self.__index
         )
@@ -119,7 +195,18 @@ def __getitem__(self, index_tuple: tuple[int | slice, int | slice]) -> Range:
 
     @property
     def slice(self) -> RangeSlice:
-        return self.__range
+        return RangeSlice(
+            row=slice(self.__index.first.row, self.__index.last.row + 1),
+            col=slice(self.__index.first.col, self.__index.last.col + 1),
+        )
+
+    @property
+    def rows(self) -> range:
+        return range(self.__index.first.row, self.__index.last.row + 1)
+
+    @property
+    def columns(self) -> range:
+        return range(self.__index.first.col, self.__index.last.col + 1)
 
     @property
     def last_cell(self) -> Index:
@@ -172,112 +259,35 @@ def expand(self, mode: str | ExpandType = ExpandType.TABLE) -> Range:
             self.current.col : last_cell.current.col + 1,
         ]
 
-    def __end_cell_row_number(
-        self,
-        range_object: range,
-        column: SupportsIndex,
-        action_time: int,
-    ) -> int:
-        def goto_end(last_row: int) -> int:
-            for row in row_range:
-                if self.sheet.cells[row][column] is None:
-                    break
-                last_row = row
-            return last_row
-
-        def skip_blank(last_row: int) -> int:
-            for row in row_range:
-                if self.sheet.cells[row][column] is not None:
-                    return row
-            return last_row
-
-        row_range = iter(range_object)
-        next_row = next(row_range)
-
-        is_start_blank = self.sheet.cells[next_row][column] is None
-        for _ in range(action_time):
-            last_row = next_row
-            match (_ + is_start_blank) % 2:
-                case 0:
-                    next_row = goto_end(last_row)
-                case 1:
-                    next_row = skip_blank(last_row)
-
-        return next_row
-
-    def __end_cell_column_number(
-        self,
-        range_object: range,
-        row: SupportsIndex,
-        action_time: int,
-    ) -> int:
-        def goto_end(last_column: int) -> int:
-            for column in column_range:
-                if self.sheet.cells[row][column] is None:
-                    break
-                last_column = column
-            return last_column
-
-        def skip_blank(last_column: int) -> int:
-            for column in column_range:
-                if self.sheet.cells[row][column] is not None:
-                    return column
-            return last_column
-
-        column_range = iter(range_object)
-        next_column = next(column_range)
-
-        is_start_blank = self.sheet.cells[row][next_column] is None
-        for _ in range(action_time):
-            last_column = next_column
-            match (_ + is_start_blank) % 2:
-                case 0:
-                    next_column = goto_end(last_column)
-                case 1:
-                    next_column = skip_blank(last_column)
-
-            if last_column == next_column:
-                break
-
-        return next_column
-
     def end(self, direction: str | DirectionType, time: int = 1) -> Range:
         """Same as `Ctrl + Arrow Keys` in Excel."""
         match DirectionType(direction):
             case DirectionType.UP:
                 return self[
-                    self.__end_cell_row_number(
-                        range_object=range(self.current.row, -1, -1),
-                        column=self.current.col,
-                        action_time=time,
+                    self.sheet.column_runs(self.current.col).end(
+                        self.current.row, -1, time
                     ),
                     self.current.col,
                 ]
             case DirectionType.DOWN:
                 return self[
-                    self.__end_cell_row_number(
-                        range_object=range(self.current.row, self.__depth),
-                        column=self.current.col,
-                        action_time=time,
+                    self.sheet.column_runs(self.current.col).end(
+                        self.current.row, 1, time
                     ),
                     self.current.col,
                 ]
             case DirectionType.LEFT:
                 return self[
                     self.current.row,
-                    self.__end_cell_column_number(
-                        range_object=range(self.current.col, -1, -1),
-                        row=self.current.row,
-                        action_time=time,
+                    self.sheet.row_runs(self.current.row).end(
+                        self.current.col, -1, time, stop_when_still=True
                     ),
                 ]
             case DirectionType.RIGHT:
                 return self[
                     self.current.row,
-                    self.__end_cell_column_number(
-                        range_object=range(self.current.col, self.__breadth),
-                        row=self.current.row,
-                        action_time=time,
+                    self.sheet.row_runs(self.current.row).end(
+                        self.current.col, 1, time, stop_when_still=True
                     ),
                 ]
             case _:
@@ -286,41 +296,50 @@ def end(self, direction: str | DirectionType, time: int = 1) -> Range:
                 )
 
     def set_format(self, format: dict[str, Any]):
-        for row_num in range(*self.slice.row.indices(self.__depth)):
-            for col_num in range(*self.slice.col.indices(self.__breadth)):
-                self.sheet.props[row_num][col_num].update(format)
+        self.sheet.add_format_layer(self.rows, self.columns, format)
 
     def merge(self, cell_format: dict[str, Any]):
-        range_format = self.sheet.props[self.__index.first.row][self.__index.first.col]
-        range_format.update(cell_format)
+        first = self.__index.first
+        self.sheet.add_format_layer(
+            range(first.row, first.row + 1),
+            range(first.col, first.col + 1),
+            cell_format,
+        )
+        range_format = self.sheet.get_cell_format(first.row, first.col)
         self.sheet.worksheet.merge_range(
             self.__index.first.row,
             self.__index.first.col,
             self.__index.last.row,
             self.__index.last.col,
             "",
-            self.sheet.workbook.add_format(range_format),
+            self.sheet.add_format(range_format),
         )
 
     def __get_column_width(
         self,
         text_list,
         column_num: int,
-        font_dict: dict[str, dict[str, dict[int, ImageFont.FreeTypeFont]]],
+        font_dict: dict[str, dict[str, dict[int, Font]]],
         font_name,
         font_size,
     ) -> float:
         """column width but in character units number."""
 
+        glyph_cache: GlyphCache | None = self.sheet.other_props.get("glyph_cache")
+
         pixels_width = 0.0
         for row_num, text in text_list:
-            if self.sheet.props[row_num][column_num].get("bold", False):
+            if self.sheet.get_cell_property(row_num, column_num, "bold", False):
                 font = font_dict[font_name]["bold"][font_size]
             else:
                 font = font_dict[font_name]["regular"][font_size]
 
             # We can get the approximate correct pixels number.
-            pixels_width = max(font.getlength(text), pixels_width)
+            if glyph_cache is None or isinstance(font, EstimatedFont):
+                text_width = font.getlength(text)
+            else:
+                text_width = glyph_cache.getlength(font, text)
+            pixels_width = max(text_width, pixels_width)
 
         # Assume per character unit width is 5 pixels (for longer width of this font used in Cell).
         # (Because the number will be showed in Scientific Notation due to the short width of Cell.)
@@ -330,7 +349,7 @@ def __get_row_height(
         self,
         text_list,
         row_num: int,
-        font_dict: dict[str, dict[str, dict[int, ImageFont.FreeTypeFont]]],
+        font_dict: dict[str, dict[str, dict[int, Font]]],
         font_name,
         font_size: int,
     ) -> float:
@@ -338,7 +357,7 @@ def __get_row_height(
 
         pixels_height = 0.0
         for column_num, text in text_list:
-            if self.sheet.props[row_num][column_num].get("bold", False):
+            if self.sheet.get_cell_property(row_num, column_num, "bold", False):
                 font = font_dict[font_name]["bold"][font_size]
             else:
                 font = font_dict[font_name]["regular"][font_size]
@@ -350,6 +369,25 @@ def __get_row_height(
 
         return pixels_height + 1
 
+    def __load_fonts(self, font_name: str, font_size: int) -> dict[str, Font] | None:
+        """加载常规与粗体字体，找不到字体文件时为 None"""
+        if (
+            "font_path" not in self.sheet.other_props
+            or font_name not in self.sheet.other_props["font_path"]
+        ):
+            warn("Failed: Not found font path! Estimating text size instead.")
+            return None
+
+        font_path: dict[str, str] = self.sheet.other_props["font_path"][font_name]
+        try:
+            return {
+                "regular": ImageFont.truetype(font_path["regular"], font_size),
+                "bold": ImageFont.truetype(font_path["bold"], font_size),
+            }
+        except OSError as e:
+            warn(f"Failed: Cannot open font file: {e}! Estimating text size instead.")
+            return None
+
     def autofit(self):
         # TODO: 优化在 WSL1 下的性能表现（行、列排版占用 40s）
         font_name: str = self.sheet.default_format_properties.get(
@@ -360,23 +398,18 @@ def autofit(self):
         )
 
         if not self.sheet.other_props.setdefault("font_init", False):
-            if (
-                "font_path" not in self.sheet.other_props
-                or font_name not in self.sheet.other_props["font_path"]
-            ):
-                warn("Failed: Not found font path!")
-                return
-
-            font_path: dict[str, str] = self.sheet.other_props["font_path"][font_name]
+            fonts = None
+            if not self.sheet.other_props.get("fast_layout", False):
+                fonts = self.__load_fonts(font_name, font_size)
+            if fonts is None:
+                # 不加载字体文件，估算文本尺寸
+                estimated_font = EstimatedFont(font_name, font_size)
+                fonts = {"regular": estimated_font, "bold": estimated_font}
 
             self.sheet.other_props["font_dict"] = {
                 font_name: {
-                    "regular": {
-                        font_size: ImageFont.truetype(font_path["regular"], font_size)
-                    },
-                    "bold": {
-                        font_size: ImageFont.truetype(font_path["bold"], font_size)
-                    },
+                    "regular": {font_size: fonts["regular"]},
+                    "bold": {font_size: fonts["bold"]},
                 }
             }
 
@@ -384,10 +417,10 @@ def autofit(self):
 
         font_dict = self.sheet.other_props["font_dict"]
 
-        for col_num in range(*self.slice.col.indices(self.__breadth)):
+        for col_num in self.columns:
             text_list = [
                 (row_num, str(self.sheet.cells[row_num][col_num]))
-                for row_num in range(*self.slice.row.indices(self.__depth))
+                for row_num in self.rows
                 if self.sheet.cells[row_num][col_num] is not None
             ]
 
@@ -403,10 +436,10 @@ def autofit(self):
             )
             self.sheet.worksheet.set_column(col_num, col_num, column_width)
 
-        for row_num in range(*self.slice.row.indices(self.__depth)):
+        for row_num in self.rows:
             text_list = [
                 (column_num, str(self.sheet.cells[row_num][column_num]))
-                for column_num in range(*self.slice.col.indices(self.__breadth))
+                for column_num in self.columns
                 if self.sheet.cells[row_num][column_num] is not None
             ]
 
@@ -433,32 +466,127 @@ def __init__(
 
         # 每个单元格对应的数据
         self.cells = data
-        # 每个单元格相应的格式
-        self.props: list[list[dict[str, Any]]] = [
-            [{} for _ in row] for row in self.cells
-        ]
+        # 表单的尺寸与整个表单的范围，由其所有的 Range 共享
+        self.depth = len(data)
+        self.breadth = len(data[0])
+        self.full_index = RangeIndex(
+            first=Index(row=0, col=0),
+            last=Index(row=self.depth - 1, col=self.breadth - 1),
+        )
+        # 格式层：(行范围, 列范围, 格式属性)，按设置的先后顺序排列，后设置的覆盖先设置的
+        # 只在写入时才合成各单元格的格式
+        self.format_layers: list[tuple[range, range, dict[str, Any]]] = []
+        # 格式层的索引：整列的格式层按列索引，其余的格式层（整行与范围）按行索引
+        self.__column_layers: dict[int, list[int]] = {}
+        self.__row_layers: dict[int, list[int]] = {}
 
         self.default_format_properties = default_format_props or {}
         self.other_props = other_props or {}
 
+        # 各行、各列中连续非空单元格的区间，首次定位时才建立
+        self.__row_runs: list[Runs] | None = None
+        self.__column_runs: list[Runs] | None = None
+
         super().__init__(sheet=self)
 
+    def __build_runs(self):
+        breadth = len(self.cells[0])
+        occupied = [
+            [col < len(row) and row[col] is not None for col in range(breadth)]
+            for row in self.cells
+        ]
+        self.__row_runs = [Runs(row) for row in occupied]
+        self.__column_runs = [Runs(list(column)) for column in zip(*occupied)]
+
+    def row_runs(self, row: int) -> Runs:
+        if self.__row_runs is None:
+            self.__build_runs()
+        return self.__row_runs[row]
+
+    def column_runs(self, col: int) -> Runs:
+        if self.__column_runs is None:
+            self.__build_runs()
+        return self.__column_runs[col]
+
+    def add_format(self, props: dict[str, Any]) -> Format:
+        """取得格式属性相同的 Format，同一 Workbook 的所有 Sheet 共享"""
+        formats = _format_cache.setdefault(self.workbook, {})
+        key = frozenset(props.items())
+        cell_format = formats.get(key)
+        if cell_format is None:
+            cell_format = formats[key] = self.workbook.add_format(props)
+        return cell_format
+
+    def add_format_layer(self, rows: range, cols: range, format: dict[str, Any]):
+        self.__add_layer(rows, cols, dict(format))
+
+    def set_formats(self, ranges: Iterable[Range], format: dict[str, Any]):
+        """为多个范围设置相同的格式，重复的范围只设置一次"""
+        format = dict(format)
+        for rows, cols in dict.fromkeys((rng.rows, rng.columns) for rng in ranges):
+            self.__add_layer(rows, cols, format)
+
+    def __add_layer(self, rows: range, cols: range, format: dict[str, Any]):
+        layer = len(self.format_layers)
+        self.format_layers.append((rows, cols, format))
+        if len(rows) >= self.depth:
+            for col in cols:
+                self.__column_layers.setdefault(col, []).append(layer)
+        else:
+            for row in rows:
+                self.__row_layers.setdefault(row, []).append(layer)
+
+    def __cell_layers(self, row: int, col: int) -> list[int]:
+        """覆盖单元格的格式层序号，按设置的先后顺序排列"""
+        layers = [
+            layer
+            for layer in self.__column_layers.get(col, ())
+            if row in self.format_layers[layer][0]
+        ]
+        layers.extend(
+            layer
+            for layer in self.__row_layers.get(row, ())
+            if col in self.format_layers[layer][1]
+        )
+        layers.sort()
+        return layers
+
+    def get_cell_format(self, row: int, col: int) -> dict[str, Any]:
+        """合成单元格的格式（不含默认格式）"""
+        cell_format: dict[str, Any] = {}
+        for layer in self.__cell_layers(row, col):
+            cell_format.update(self.format_layers[layer][2])
+        return cell_format
+
+    def get_cell_property(
+        self, row: int, col: int, key: str, default: Any = None
+    ) -> Any:
+        """单元格的某一格式属性，从后设置的格式层开始查找"""
+        for layer in reversed(self.__cell_layers(row, col)):
+            format = self.format_layers[layer][2]
+            if key in format:
+                return format[key]
+        return default
+
     def write(self):
+        # 覆盖的格式层相同的单元格格式相同：{格式层序号: Format}
+        formats: dict[tuple[int, ...], Format | None] = {}
         for row, row_data in enumerate(self.cells):
             for col, data in enumerate(row_data):
                 if data is None:
                     continue
 
-                format_props = {
-                    **self.default_format_properties,
-                    **self.props[row][col],
-                }
-                if len(format_props) == 0:
+                layers = tuple(self.__cell_layers(row, col))
+                if layers not in formats:
+                    format_props = self.default_format_properties.copy()
+                    for layer in layers:
+                        format_props.update(self.format_layers[layer][2])
+                    formats[layers] = (
+                        self.add_format(format_props) if len(format_props) else None
+                    )
+
+                cell_format = formats[layers]
+                if cell_format is None:
                     self.worksheet.write(row, col, data)
                 else:
-                    self.worksheet.write(
-                        row,
-                        col,
-                        data,
-                        self.workbook.add_format(format_props),
-                    )
+                    self.worksheet.write(row, col, data, cell_format)
@@ -0,0 +1,297 @@
+import warnings
+from array import array
+from typing import Any
+
+from .tally import SpeakerTally
+
+_TOTAL_KEYS = ("commands", "words", "punctuation", "ellipsis")
+
+
+class CountFacts:
+    """统计结果的列式事实表
+
+    统计树的节点（剧情路径、入口类型、关卡等）与说话人均以整数 id 表示，
+    每个剧情一行（所属节点、指令数），每个剧情中的每个说话人一行（所属剧情、说话人、字数等），
+    各列均为 `array`。`{"info": ..., "items": ...}` 形式的统计树由 `tree` 按需汇总得到。
+    """
+
+    def __init__(self, count_ellipsis: bool = True):
+        # 省略号是否计入剧情的省略号数
+        self.count_ellipsis = count_ellipsis
+
+        # 节点：0 为根节点，子节点按添加的顺序排列
+        self.node_parent = array("q", [-1])
+        self.node_key: list[str] = [""]
+        self.node_info: list[dict[str, Any]] = [{}]
+        self.__node_ids: dict[tuple[int, str], int] = {}
+
+        self.speakers: list[str] = []
+        self.__speaker_ids: dict[str, int] = {}
+
+        # 剧情
+        self.story_node = array("q")
+        self.story_commands = array("q")
+
+        # 剧情中的说话人，按剧情及说话人在剧情中首次出现的顺序排列
+        self.fact_story = array("q")
+        self.fact_speaker = array("q")
+        self.fact_words = array("q")
+        self.fact_punctuation = array("q")
+        self.fact_ellipsis = array("q")
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        # 查找表可由节点与说话人列重建，不必保存
+        del state["_CountFacts__node_ids"]
+        del state["_CountFacts__speaker_ids"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__dict__.update(state)
+        self.__node_ids = {
+            (parent, key): node
+            for node, (parent, key) in enumerate(zip(self.node_parent, self.node_key))
+            if node
+        }
+        self.__speaker_ids = {name: i for i, name in enumerate(self.speakers)}
+
+    def __len__(self) -> int:
+        return len(self.story_node)
+
+    def node(self, parent: int, key: str, info: dict[str, Any] | None = None) -> int:
+        """查找或添加子节点，`info` 只在添加时使用
+
+        Returns:
+            int: 子节点的 id
+        """
+        node = self.__node_ids.get((parent, key))
+        if node is None:
+            node = len(self.node_key)
+            self.__node_ids[parent, key] = node
+            self.node_parent.append(parent)
+            self.node_key.append(key)
+            self.node_info.append({} if info is None else info)
+        return node
+
+    def add_story(
+        self, node: int, command_count: int, counter_dict: dict[str, SpeakerTally]
+    ):
+        story = len(self.story_node)
+        self.story_node.append(node)
+        self.story_commands.append(command_count)
+        for name, tally in counter_dict.items():
+            speaker = self.__speaker_ids.get(name)
+            if speaker is None:
+                speaker = self.__speaker_ids[name] = len(self.speakers)
+                self.speakers.append(name)
+            self.fact_story.append(story)
+            self.fact_speaker.append(speaker)
+            self.fact_words.append(tally["words"])
+            self.fact_punctuation.append(tally["punctuation"])
+            self.fact_ellipsis.append(tally["ellipsis"])
+
+    def __aggregate(
+        self,
+    ) -> tuple[list[list[int]], list[dict[str, SpeakerTally]]]:
+        """先将各行汇总到剧情所属的节点，再自下而上逐层汇总到父节点
+
+        各节点中说话人的顺序为其在该节点下首次出现的顺序：事实表按剧情及说话人首次出现的顺序排列，
+        以说话人在该节点下最早的行号排序即可。
+        """
+        totals = [[0] * len(_TOTAL_KEYS) for _ in self.node_key]
+        counters: list[dict[str, SpeakerTally]] = [{} for _ in self.node_key]
+        # {说话人: 在该节点下首次出现的行号}
+        first_rows: list[dict[str, int]] = [{} for _ in self.node_key]
+
+        for node, command_count in zip(self.story_node, self.story_commands):
+            totals[node][0] += command_count
+
+        for row, (story, speaker, words, punctuation, ellipsis) in enumerate(
+            zip(
+                self.fact_story,
+                self.fact_speaker,
+                self.fact_words,
+                self.fact_punctuation,
+                self.fact_ellipsis,
+            )
+        ):
+            node = self.story_node[story]
+            total = totals[node]
+            total[1] += words
+            total[2] += punctuation
+            if self.count_ellipsis:
+                total[3] += ellipsis
+
+            name = self.speakers[speaker]
+            counter = counters[node]
+            if name in counter:
+                tally = counter[name]
+                tally["words"] += words
+                tally["punctuation"] += punctuation
+                tally["ellipsis"] += ellipsis
+            else:
+                counter[name] = {
+                    "words": words,
+                    "punctuation": punctuation,
+                    "ellipsis": ellipsis,
+                }
+                first_rows[node][name] = row
+
+        # 合并了多个来源的节点，须按说话人首次出现的行号重新排序
+        unordered: set[int] = set()
+
+        def reorder(node: int):
+            if node in unordered:
+                counter, rows = counters[node], first_rows[node]
+                counters[node] = {
+                    name: counter[name]
+                    for name in sorted(counter, key=rows.__getitem__)
+                }
+
+        # 子节点总在父节点之后添加，倒序遍历时各节点的子节点均已汇总到该节点
+        for node in range(len(self.node_key) - 1, 0, -1):
+            reorder(node)
+            parent = self.node_parent[node]
+            total, parent_total = totals[node], totals[parent]
+            for i in range(len(_TOTAL_KEYS)):
+                parent_total[i] += total[i]
+
+            counter, parent_counter = counters[node], counters[parent]
+            if not counter:
+                continue
+            if not parent_counter:
+                counters[parent] = {
+                    name: tally.copy() for name, tally in counter.items()
+                }
+                first_rows[parent] = first_rows[node].copy()
+                continue
+
+            unordered.add(parent)
+            node_first_rows, parent_first_rows = first_rows[node], first_rows[parent]
+            for name, tally in counter.items():
+                if name in parent_counter:
+                    parent_tally = parent_counter[name]
+                    parent_tally["words"] += tally["words"]
+                    parent_tally["punctuation"] += tally["punctuation"]
+                    parent_tally["ellipsis"] += tally["ellipsis"]
+                    row = node_first_rows[name]
+                    if row < parent_first_rows[name]:
+                        parent_first_rows[name] = row
+                else:
+                    parent_counter[name] = tally.copy()
+                    parent_first_rows[name] = node_first_rows[name]
+        reorder(0)
+
+        return totals, counters
+
+    def __aggregate_numpy(
+        self,
+    ) -> tuple[list[list[int]], list[dict[str, SpeakerTally]]]:
+        """与 `__aggregate` 相同，以 NumPy 分组求和"""
+        import numpy as np
+
+        node_count = len(self.node_key)
+        speaker_count = max(len(self.speakers), 1)
+        story_node = np.frombuffer(self.story_node, dtype=np.int64)
+        fact_node = story_node[np.frombuffer(self.fact_story, dtype=np.int64)]
+        fact_speaker = np.frombuffer(self.fact_speaker, dtype=np.int64)
+        values = [
+            np.frombuffer(self.story_commands, dtype=np.int64),
+            np.frombuffer(self.fact_words, dtype=np.int64),
+            np.frombuffer(self.fact_punctuation, dtype=np.int64),
+            np.frombuffer(self.fact_ellipsis, dtype=np.int64),
+        ]
+
+        # 展开为 (祖先节点, 行号) 对：每一层祖先各一组
+        ancestor_of = np.arange(node_count)
+        story_groups: list[tuple[np.ndarray, np.ndarray]] = []
+        fact_groups: list[tuple[np.ndarray, np.ndarray]] = []
+        node_parent = np.frombuffer(self.node_parent, dtype=np.int64)
+        while True:
+            valid = ancestor_of >= 0
+            if not valid.any():
+                break
+            story_ancestor = ancestor_of[story_node]
+            rows = np.flatnonzero(story_ancestor >= 0)
+            story_groups.append((story_ancestor[rows], rows))
+            fact_ancestor = ancestor_of[fact_node]
+            rows = np.flatnonzero(fact_ancestor >= 0)
+            fact_groups.append((fact_ancestor[rows], rows))
+            ancestor_of = np.where(valid, node_parent[np.maximum(ancestor_of, 0)], -1)
+
+        def group_sum(keys: np.ndarray, weights: np.ndarray, size: int) -> np.ndarray:
+            return (
+                np.bincount(keys, weights=weights, minlength=size)
+                .round()
+                .astype(np.int64)
+            )
+
+        story_ancestor = np.concatenate([group[0] for group in story_groups])
+        story_rows = np.concatenate([group[1] for group in story_groups])
+        fact_ancestor = np.concatenate([group[0] for group in fact_groups])
+        fact_rows = np.concatenate([group[1] for group in fact_groups])
+
+        totals_columns = [
+            group_sum(story_ancestor, values[0][story_rows], node_count),
+            group_sum(fact_ancestor, values[1][fact_rows], node_count),
+            group_sum(fact_ancestor, values[2][fact_rows], node_count),
+            group_sum(fact_ancestor, values[3][fact_rows], node_count)
+            if self.count_ellipsis
+            else np.zeros(node_count, dtype=np.int64),
+        ]
+        totals = np.stack(totals_columns, axis=1).tolist()
+
+        # 按 (节点, 说话人) 分组，以组内最小的行号作为说话人首次出现的位置
+        keys = fact_ancestor * speaker_count + fact_speaker[fact_rows]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        first_rows = np.full(unique_keys.size, fact_rows.size, dtype=np.int64)
+        np.minimum.at(first_rows, inverse, fact_rows)
+        sums = [
+            group_sum(inverse, values[i][fact_rows], unique_keys.size)
+            for i in range(1, len(values))
+        ]
+
+        counters: list[dict[str, SpeakerTally]] = [{} for _ in range(node_count)]
+        order = np.lexsort((first_rows, unique_keys // speaker_count))
+        for key, words, punctuation, ellipsis in zip(
+            unique_keys[order].tolist(),
+            sums[0][order].tolist(),
+            sums[1][order].tolist(),
+            sums[2][order].tolist(),
+        ):
+            node, speaker = divmod(key, speaker_count)
+            counters[node][self.speakers[speaker]] = {
+                "words": words,
+                "punctuation": punctuation,
+                "ellipsis": ellipsis,
+            }
+
+        return totals, counters
+
+    def tree(self, use_numpy: bool = False) -> dict[str, dict]:
+        """汇总得到 `{"info": ..., "items": ...}` 形式的统计树，每次调用都返回新的字典
+
+        Args:
+            use_numpy (bool, optional): 是否以 NumPy 分组求和. Defaults to False.
+        """
+        aggregate = self.__aggregate
+        if use_numpy:
+            try:
+                import numpy  # noqa: F401
+
+                aggregate = self.__aggregate_numpy
+            except ImportError:
+                warnings.warn("numpy not found, aggregating counts without it.")
+        totals, counters = aggregate()
+
+        nodes: list[dict[str, dict]] = []
+        for node, info in enumerate(self.node_info):
+            info = info.copy()
+            if len(counters[node]):
+                info.update(zip(_TOTAL_KEYS, totals[node]))
+                info["counter"] = counters[node]
+            nodes.append({"info": info, "items": {}})
+            parent = self.node_parent[node]
+            if parent >= 0:
+                nodes[parent]["items"][self.node_key[node]] = nodes[node]
+        return nodes[0]
@@ -1,18 +1,25 @@
 import json
-import pickle
 from argparse import Namespace
 from pathlib import Path
-
-from tqdm import tqdm
+from typing import Self
 
 from .base import Info
+from .cache import Cache, Manifest, PickleCache, SqliteCache
+from .catalog import StoryCatalog
 from .count import Count
 from .dump import Dump
+from .facts import CountFacts
+from .speaker import build_speaker_index
+from .story import StoryChangedError, StoryFile, StoryStore
+from .utils import thread_map
+from .version import (
+    parse_version,
+    read_data_version,
+    write_cached_version,
+)
 
 
 class GameData(Count, Dump):
-    __unknown: dict[str, list[str]] = {"files": [], "commands": [], "heads": []}
-
     __need_update: bool = False
     __updated: bool = False
     __counted: bool = False
@@ -32,10 +39,29 @@ def __init__(
         self.__pickle_file = Path(config.pickle_file_path)
         self.__json_file = Path(config.json_file_path)
 
+        excel_dir = self.data_dir / "excel"
+        self.__story_dir = self.data_dir / "story"
+
+        self.__unknown: dict[str, list[str]] = {
+            "files": [],
+            "commands": [],
+            "heads": [],
+        }
+        # 缓存数据在首次访问 `data` 时才加载
+        self.__data: dict[str, dict[str, dict]] | None = None
+
+        self.__cache: Cache
+        if args.sqlite:
+            self.__cache = SqliteCache(Path(config.sqlite_file_path))
+        else:
+            self.__cache = PickleCache(self.__pickle_file)
+
         Count.__init__(
             self=self,
             config=count_config,
             unknown=self.__unknown,
+            story_dir=self.__story_dir,
+            cache=self.__cache,
             args=args,
         )
         Dump.__init__(
@@ -49,13 +75,13 @@ def __init__(
         self.__unknown_files_file = self.__pickle_file.with_name(
             f"{self.__pickle_file.stem}_unknown_files.txt"
         )
-
-        excel_dir = self.data_dir / "excel"
-        self.__story_dir = self.data_dir / "story"
+        self.__manifest: Manifest | None = None
 
         self.__data_version_path = excel_dir / "data_version.txt"
         if not self.__data_version_path.exists():
             raise FileNotFoundError(f"{self.__data_version_path.absolute()} not found!")
+        self.__version_file = Path(config.version_file_path)
+        self.__version = read_data_version(self.__data_version_path)
 
         self.__excel_dirs: dict[str, Path] = {
             "activity_table": excel_dir / "activity_table.json",
@@ -70,7 +96,15 @@ def __init__(
             "obt": self.__story_dir / "obt",
         }
 
-        self.__load_data()
+    @property
+    def data(self) -> dict[str, dict[str, dict]]:
+        if self.__data is None:
+            self.__load_data()
+        return self.__data
+
+    @data.setter
+    def data(self, value: dict[str, dict[str, dict]]):
+        self.__data = value
 
     @property
     def version(self) -> tuple[int, ...]:
@@ -82,20 +116,21 @@ def version(self) -> tuple[int, ...]:
 
     @property
     def need_update(self) -> bool:
+        if self.__data is None:
+            self.__load_data()
         return self.__need_update
 
     @Info("loading...")
     def __load_data(self):
-        def parse_version(ver: str):
-            return tuple(int(x) for x in ver.split("."))
-
-        if self.__pickle_file.exists():
-            self.data = pickle.loads(self.__pickle_file.read_bytes())
-        elif not self.__pickle_file.parent.exists():
-            self.__pickle_file.parent.mkdir(parents=True)
+        self.__data = self.__cache.load()
+        # 旧版缓存中没有说话人索引，统计结果也不是事实表，须重新更新
+        if (
+            self.__cache.stale
+            or self.data["excel"].get("speaker_index") is None
+            or not isinstance(self.data["count"], CountFacts)
+        ):
+            self.__need_update = True
 
-        content = self.__data_version_path.read_text(encoding="utf-8")
-        self.__version = parse_version(content.split(":")[-1].strip())
         # self.__date = date.fromisoformat(content.split()[-2].strip().replace("/", "-"))
 
         info_data = self.data["info"]["data"]
@@ -115,38 +150,68 @@ def parse_version(ver: str):
         if self.version > old_version:
             self.__need_update = True
 
+    def __scan_manifest(self, files: list[Path]) -> Manifest:
+        """更新剧情文件清单
+
+        文件大小与修改时间均未变化的文件直接沿用清单记录，只有新增或修改过的文件才会被读取并计算哈希。
+
+        Args:
+            files (list[Path]): 当前所有的剧情文件
+
+        Returns:
+            Manifest: {相对路径: (文件大小, 修改时间, 内容哈希)}
+        """
+        old_manifest = self.__cache.load_manifest()
+
+        def scan(file: Path) -> tuple[str, tuple[int, int, str]]:
+            key = file.relative_to(self.__story_dir).as_posix()
+            stat = file.stat()
+            entry = old_manifest.get(key)
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                return key, entry
+
+            digest = StoryStore.digest(file.read_bytes())
+            return key, (stat.st_size, stat.st_mtime_ns, digest)
+
+        manifest = dict(thread_map(scan, files, "manifest"))
+
+        # 待剧情数据保存后再写入清单
+        self.__manifest = manifest
+        return manifest
+
     @Info("updating story...")
     def __update_story(self):
-        info_files = self.__story_dirs["info"].rglob("*.txt")
+        info_files = list(self.__story_dirs["info"].rglob("*.txt"))
         activity_files = self.__story_dirs["activities"].rglob("*.txt")
         obt_files = self.__story_dirs["obt"].rglob("*.txt")
         files = list(activity_files) + list(obt_files)
-        self.data["story"] = {}
-
-        for info in tqdm(list(info_files), "files"):
-            info_relative_path = info.relative_to(self.__story_dirs["info"])
-            story_key = info_relative_path.with_suffix("").as_posix()
-            file = self.__story_dir / info_relative_path
-            if file in files:
-                files.remove(file)
-                txt = file.read_text(encoding="utf-8")
-            else:
-                txt = ""
-                if self.__debug:
-                    # warnings.warn(f"{file} not found!")
-                    self.__unknown["files"].append(file.as_posix())
-            self.data["story"][story_key] = {
-                "info": info.read_text(encoding="utf-8"),
-                "txt": txt,
-            }
 
-        for file in files:
-            file_relative_path = file.relative_to(self.__story_dir)
-            story_key = file_relative_path.with_suffix("").as_posix()
-            self.data["story"][story_key] = {
-                "info": "",
-                "txt": file.read_text(encoding="utf-8"),
+        manifest = self.__scan_manifest(info_files + files)
+
+        catalog = StoryCatalog(
+            self.__story_dirs["info"].relative_to(self.__story_dir).as_posix()
+        )
+        for file in info_files + files:
+            catalog.add(file.relative_to(self.__story_dir).as_posix())
+
+        def story_file(path: str | None) -> StoryFile | None:
+            return None if path is None else (path, manifest[path][2])
+
+        # 只记录剧情文件的路径与哈希，文本在解析时再读取
+        self.data["story"] = {
+            story_key: {
+                "info": story_file(catalog[story_key].info),
+                "txt": story_file(catalog[story_key].txt),
             }
+            for story_key in catalog
+        }
+
+        if self.__debug:
+            for story_key in catalog:
+                if catalog[story_key].txt is None:
+                    # warnings.warn(f"{file} not found!")
+                    file = self.__story_dir / f"{story_key}.txt"
+                    self.__unknown["files"].append(file.as_posix())
 
         if len(self.__unknown["files"]):
             tmp_text = ""
@@ -154,14 +219,35 @@ def __update_story(self):
                 tmp_text += f'"{i}",\n'
             self.__unknown_files_file.write_text(tmp_text)
 
+    def close(self):
+        """关闭缓存"""
+        self.__cache.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     @Info("updating...")
     def update(self):
         if self.__updated:
             return
         self.__updated = True
 
-        for i in self.__excel_dirs:
-            self.data["excel"][i] = json.loads(self.__excel_dirs[i].read_bytes())
+        tables = thread_map(
+            lambda path: json.loads(path.read_bytes()),
+            list(self.__excel_dirs.values()),
+        )
+        excel = dict(zip(self.__excel_dirs, tables))
+        # 只保存由这两张表建立的说话人索引，不再缓存体积较大的干员档案
+        self.data["excel"]["speaker_index"] = build_speaker_index(
+            excel.pop("story_variables"), excel.pop("handbook_info_table")
+        )
+        for i in ("story_variables", "handbook_info_table"):
+            self.data["excel"].pop(i, None)
+        for i, table in excel.items():
+            self.data["excel"][i] = table
 
         self.__update_story()
         self.count()
@@ -172,8 +258,32 @@ def count(self):
             return
         self.__counted = True
 
-        self.count_words()
-        self.__pickle_file.write_bytes(pickle.dumps(self.data))
+        try:
+            self.count_words()
+        except StoryChangedError as e:
+            # 文件大小与修改时间可能未变，丢弃其清单记录，使下次更新时重新计算哈希
+            manifest = self.__cache.load_manifest()
+            if manifest.pop(e.path, None) is not None:
+                self.__cache.save_manifest(manifest)
+            raise
+        self.__cache.save(
+            self.data,
+            ("excel", "story", "count", "info")
+            if self.__updated
+            else ("count", "info"),
+        )
+        if self.__manifest is not None:
+            self.__cache.save_manifest(self.__manifest)
+            self.__manifest = None
+
+        # 供 `--test_update` 快速比较版本，无须加载缓存
+        write_cached_version(
+            self.__version_file,
+            max(
+                parse_version(self.data["excel"]["gamedata_const"]["dataVersion"]),
+                parse_version(self.data["info"]["data"].get("数据版本", "0.0.0")),
+            ),
+        )
 
     @Info("start dumping...")
     def dump(self) -> Path:
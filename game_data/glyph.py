@@ -0,0 +1,149 @@
+import pickle
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from weakref import WeakKeyDictionary
+
+from PIL import ImageFont
+
+# 字体：(字体文件, 文件大小, 修改时间, 字号, 排版引擎)
+FontKey = tuple[str, int, int, int, int]
+
+
+class GlyphCache:
+    """字形宽度缓存，可跨运行保存
+
+    每种字体的每个字符只测量一次，字符串宽度即各字符宽度之和。
+    相邻两字符的宽度不等于各自宽度之和（字距调整、连字等）时，含有这两个字符的字符串仍以 `getlength` 测量。
+    字体以字体文件及其大小、修改时间区分，替换字体文件后不会沿用旧字体的宽度。
+    """
+
+    __VERSION = 2
+
+    def __init__(self, cache_file: Path | None = None):
+        self.__cache_file = cache_file
+        # {字体: {字符: 宽度}}
+        self.__advances: dict[FontKey, dict[str, float]] = {}
+        # {字体: {相邻两字符: 是否需要以 `getlength` 测量}}
+        self.__kerning: dict[FontKey, dict[str, bool]] = {}
+        self.__font_keys: WeakKeyDictionary[ImageFont.FreeTypeFont, FontKey] = (
+            WeakKeyDictionary()
+        )
+        self.__loaded = False
+        self.__changed = False
+
+    def __load(self):
+        self.__loaded = True
+        if self.__cache_file is None or not self.__cache_file.exists():
+            return
+        try:
+            version, advances, kerning = pickle.loads(self.__cache_file.read_bytes())
+        except Exception:
+            # 缓存文件损坏时重新测量
+            return
+        if version == self.__VERSION:
+            self.__advances, self.__kerning = advances, kerning
+
+    def save(self):
+        if self.__cache_file is None or not self.__changed:
+            return
+        self.__cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.__cache_file.write_bytes(
+            pickle.dumps((self.__VERSION, self.__advances, self.__kerning))
+        )
+        self.__changed = False
+
+    def __font_key(self, font: ImageFont.FreeTypeFont) -> FontKey:
+        font_key = self.__font_keys.get(font)
+        if font_key is None:
+            path = Path(font.path).resolve()
+            stat = path.stat()
+            font_key = self.__font_keys[font] = (
+                path.as_posix(),
+                stat.st_size,
+                stat.st_mtime_ns,
+                font.size,
+                int(font.layout_engine),
+            )
+        return font_key
+
+    def getlength(self, font: ImageFont.FreeTypeFont, text: str) -> float:
+        """与 `font.getlength(text)` 相同"""
+        if not self.__loaded:
+            self.__load()
+
+        font_key = self.__font_key(font)
+        advances = self.__advances.setdefault(font_key, {})
+        kerning = self.__kerning.setdefault(font_key, {})
+
+        length = 0.0
+        for char in text:
+            advance = advances.get(char)
+            if advance is None:
+                advance = advances[char] = font.getlength(char)
+                self.__changed = True
+            length += advance
+
+        for i in range(len(text) - 1):
+            pair = text[i : i + 2]
+            kerned = kerning.get(pair)
+            if kerned is None:
+                kerned = kerning[pair] = font.getlength(pair) != (
+                    advances[pair[0]] + advances[pair[1]]
+                )
+                self.__changed = True
+            if kerned:
+                return font.getlength(text)
+
+        return length
+
+
+@dataclass(frozen=True)
+class FontProfile:
+    """字体的近似度量，以字号为单位"""
+
+    # 半角字符（east_asian_width 为 Na、H、N）的宽度
+    narrow: float = 0.5
+    # 全角字符（east_asian_width 为 W、F）的宽度
+    wide: float = 1.0
+    # 宽度不定的字符（east_asian_width 为 A）的宽度
+    ambiguous: float = 0.5
+    # 文本包围盒的底部距顶部（上伸部）的距离
+    bottom: float = 1.15
+
+
+# 各字体的近似度量，未列出的字体使用默认值
+FONT_PROFILES: dict[str, FontProfile] = {
+    # 等宽字体，中文版本中宽度不定的字符（…、— 等）为全角
+    "Sarasa Mono Slab SC": FontProfile(ambiguous=1.0),
+    "Calibri": FontProfile(bottom=1.0),
+}
+
+
+class EstimatedFont:
+    """不加载字体文件，按 `unicodedata.east_asian_width` 与字体的近似度量估算文本尺寸
+
+    提供与 `ImageFont.FreeTypeFont` 相同的 `getlength` 与 `getbbox`。
+    """
+
+    def __init__(self, font_name: str, size: int):
+        profile = FONT_PROFILES.get(font_name, FontProfile())
+        self.size = size
+        self.__widths = {
+            "W": profile.wide * size,
+            "F": profile.wide * size,
+            "A": profile.ambiguous * size,
+        }
+        self.__narrow = profile.narrow * size
+        self.__bottom = round(profile.bottom * size)
+
+    def getlength(self, text: str) -> float:
+        return sum(
+            0.0
+            if unicodedata.combining(char)
+            else self.__widths.get(unicodedata.east_asian_width(char), self.__narrow)
+            for char in text
+        )
+
+    def getbbox(self, text: str) -> tuple[int, int, int, int]:
+        return 0, 0, round(self.getlength(text)), self.__bottom if text else 0
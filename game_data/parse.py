@@ -1,38 +1,60 @@
-import collections
+import hashlib
+import json
 import re
-import warnings
 from argparse import Namespace
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 from .base import Base
+from .speaker import SpeakerIndex, SpeakerResolver
+from .story import StoryFile, StoryStore
+from .tally import SpeakerTally, Tally, get_tally
+
+# 指令处理器：(command, text) -> (is_command, name, text)
+CommandHandler = Callable[[str, str], tuple[bool, str, str]]
 
 
 class Parse(Base):
+    # 解析逻辑有改动时须递增此版本号，以使已缓存的解析结果失效
+    __VERSION = 4
     __ASIDE_NAME = "『旁白』"
     __command_pattern = re.compile(r"\w+")
-    __text_pattern = re.compile(r"(?:\[(.+)\])?(.+)?", re.MULTILINE)
     __subtitle_pattern = re.compile(
         r"(<[A-Za-z\d/=#@\.]+>)|({@[Nn]ickname})|(\\r)|(\\n)"
     )
     # 核心科技（）
-    __line_pattern = re.compile(
+    # 按顺序依次尝试：单词、字幕标记、点与破折号、其余字符。
+    # 其余字符不含任何可能作为字幕标记或单词开头的字符，遇到这些字符时回到前面的分支重新匹配，
+    # 都匹配不上时才作为单个字符，与先替换字幕标记再查找单词的结果一致。
+    __token_pattern = re.compile(
         r"""
-        ([AaPp]\.?[Mm](?!\w)\.?)
+        (
+            [AaPp]\.?[Mm](?!\w)\.?
+            |
+            -?[\u03B1-\u03C9\d]+(?:[\.\-:：]\d+)?(?:%|℃|u/L|M)?
+            |
+            (?:[A-Za-z]+\.(?!\.))+[A-Za-z]*
+            |
+            [A-Za-z\u03B1-\u03C9\u0400-\u04FF\u00C0-\u00D6\u00D8-\u00F6\u00F8-\u00FF\d]+(?:[/—\-']?[A-Za-z\d]+)*
+        )
         |
-        (-?[\u03B1-\u03C9\d]+(?:[\.\-:：]\d+)?(?:%|℃|u/L|M)?)
+        (<[A-Za-z\d/=#@\.]+>|{@[Nn]ickname}|\\r|\\n)
         |
-        ((?:[A-Za-z]+\.(?!\.))+[A-Za-z]*)
+        ([.…—]+)
         |
-        ([A-Za-z\u03B1-\u03C9\u0400-\u04FF\u00C0-\u00D6\u00D8-\u00F6\u00F8-\u00FF\d]+(?:[/—\-']?[A-Za-z\d]+)*)
+        ([^<{\\\-\dA-Za-z\u03B1-\u03C9\u0400-\u04FF\u00C0-\u00D6\u00D8-\u00F6\u00F8-\u00FF.…—]+|.)
         """,
-        re.VERBOSE,
+        re.VERBOSE | re.DOTALL,
     )
 
     def __init__(
         self,
         known_commands: list[str],
         unknown: dict[str, list[str]],
+        story_dir: Path,
         args: Namespace,
     ):
+        self.__store = StoryStore(story_dir)
         self.__known_commands: list[str] = known_commands
         self.__unknown_commands: list[str] = unknown["commands"]
         self.__unknown_heads: list[str] = unknown["heads"]
@@ -40,130 +62,176 @@ def __init__(
         self.__debug: bool = args.debug
         self.__count_info: bool = args.count_info
 
-    def __parse_line(
-        self, command: str, text: str
-    ) -> tuple[bool, str, collections.Counter]:
-        def get_attribute(cmd_str: str):
-            # TODO: use regex
-            return cmd_str.split(",")[0].split("=")[1].strip(" '\")")
+        from string import punctuation as punc_en
 
-        # TODO: 使用立绘判断身份
-        is_command = True
+        from zhon.hanzi import punctuation as punc_zh
+
+        self.punctuation: frozenset[str] = frozenset(punc_en + punc_zh)
+        self.__tally: Tally = get_tally(self.punctuation, args.numpy)
+        self.__speaker_index: SpeakerIndex | None = None
+        self.__speakers: SpeakerResolver
+
+        # 指令分派表：先按原样查找，找不到时再按 casefold 后的指令查找
+        self.__commands: dict[str, CommandHandler] = {}
+        self.__folded_commands: dict[str, CommandHandler] = {}
+        self.register_command(("HEADER", "Title", "Div"), self.__parse_header)
+        self.register_command(
+            (
+                "Dialog",
+                "popupdialog",
+                "VoiceWithin",
+                "dialog",
+                "warp",
+                "animtext",
+            ),
+            self.__parse_dialog,
+        )
+        self.register_command("PopupDialog", self.__parse_popup_dialog)
+        self.register_command("name", self.__parse_name)
+        self.register_command(("Decision", "decision"), self.__parse_decision)
+        self.register_command(
+            ("Sticker", "Subtitle", "spellsticker"), self.__parse_sticker
+        )
+        self.register_command(
+            ("narration", "Narration", "isAvatarRight"), self.__parse_narration
+        )
+        self.register_command("multiline", self.__parse_multiline)
+        self.register_command(("tutorial", "Tutorial"), self.__parse_command)
+        # 大小写不同的写法（如 header 与 HEADER）优先交由上面的处理器处理
+        self.register_command(known_commands, self.__parse_command)
+
+    def register_command(self, commands: str | Iterable[str], handler: CommandHandler):
+        """注册指令处理器
+
+        Args:
+            commands (str | Iterable[str]): 指令名，区分大小写；大小写不同的其他写法以最先注册的为准
+            handler (CommandHandler): 接收 (command, text)，返回 (is_command, name, text)
+        """
+        if isinstance(commands, str):
+            commands = (commands,)
+        for control_command in commands:
+            self.__commands[control_command] = handler
+            self.__folded_commands.setdefault(control_command.casefold(), handler)
+
+    def __get_handler(self, command: str) -> CommandHandler | None:
         control_command = self.__command_pattern.match(command)
         if control_command is None:
-            control_command = command
-        else:
-            control_command = control_command.group()
-
-        if control_command in self.__known_commands or command.startswith("[character"):
-            return True, "", collections.Counter()
-        elif control_command in (
-            "HEADER",
-            "Title",
-            "Div",
-        ):
-            return False, "", collections.Counter()
-        elif control_command in (
-            "Dialog",
-            "PopupDialog",
-            "popupdialog",
-            "VoiceWithin",
-            "dialog",
-            "warp",
-            "animtext",
-        ):
-            # TODO: dialog(head="npc_694_1" 文 activity_table charCardMap
-            try:
-                head = get_attribute(command)
-            except IndexError:
-                return True, "", collections.Counter()
-            if control_command == "PopupDialog":
-                try:
-                    head = self.data["excel"]["story_variables"][head.lstrip("$")]
-                except KeyError:
-                    # PopupDialog(dialogHead="char_007_closre_1")
-                    warnings.warn(f"not found {head}")
-                    name = head
-                    if self.__debug and head not in self.__unknown_heads:
-                        self.__unknown_heads.append(head)
-            if head.startswith("char"):
-                try:
-                    story_text: str = self.data["excel"]["handbook_info_table"][
-                        "handbookDict"
-                    ][head]["storyTextAudio"][0]["stories"][0]["storyText"]
-                    name = story_text.split("\n")[0].replace("【代号】", "")
-                except KeyError:
-                    if head in ("char_340_shwazr6"):
-                        name = "黑"
-                    else:
-                        warnings.warn(f"not found {head}")
-                        name = head
+            if command.startswith("[character"):
+                return self.__parse_command
+            if command.startswith("(name"):
+                return self.__parse_name
+            self.__record_unknown(command)
+            return None
+
+        control_command = control_command.group()
+        handler = self.__commands.get(control_command)
+        if handler is None:
+            handler = self.__folded_commands.get(control_command.casefold())
+        if handler is None:
+            self.__record_unknown(control_command)
+        return handler
+
+    @staticmethod
+    def __get_attribute(cmd_str: str) -> str:
+        # TODO: use regex
+        return cmd_str.split(",")[0].split("=")[1].strip(" '\")")
+
+    def __record_unknown(self, control_command: str):
+        if self.__debug and control_command not in self.__unknown_commands:
+            # warnings.warn(f"unknwn command: {command}")
+            self.__unknown_commands.append(control_command)
+
+    def __parse_command(self, command: str, text: str) -> tuple[bool, str, str]:
+        return True, "", ""
+
+    def __parse_header(self, command: str, text: str) -> tuple[bool, str, str]:
+        return False, "", ""
+
+    def __parse_popup_dialog(self, command: str, text: str) -> tuple[bool, str, str]:
+        return self.__parse_dialog(command, text, popup=True)
+
+    def __speaker_resolver(self) -> SpeakerResolver:
+        speaker_index = self.data["excel"]["speaker_index"]
+        if self.__speaker_index is not speaker_index:
+            self.__speaker_index = speaker_index
+            self.__speakers = SpeakerResolver(speaker_index)
+        return self.__speakers
+
+    def __parse_dialog(
+        self, command: str, text: str, popup: bool = False
+    ) -> tuple[bool, str, str]:
+        # TODO: dialog(head="npc_694_1" 文 activity_table charCardMap
+        try:
+            head = self.__get_attribute(command)
+        except IndexError:
+            return True, "", ""
+        speakers = self.__speaker_resolver()
+        if popup:
+            resolved = speakers.variable(head)
+            if resolved is None:
+                # PopupDialog(dialogHead="char_007_closre_1")
+                if self.__debug and head not in self.__unknown_heads:
+                    self.__unknown_heads.append(head)
             else:
-                if "head" not in command:
-                    name = self.__ASIDE_NAME
-                    if (
-                        self.__debug
-                        and (debug_info := f"no head: {head}")
-                        not in self.__unknown_heads
-                    ):
-                        self.__unknown_heads.append(debug_info)
-                else:
-                    name = head
-                    if self.__debug and head not in self.__unknown_heads:
-                        self.__unknown_heads.append(head)
-        elif control_command in ("name") or command.startswith("(name"):
-            is_command = False
-            name = get_attribute(command)
-            if name == "":
+                head = resolved
+        if head.startswith("char"):
+            name = speakers.name(head)
+        else:
+            if "head" not in command:
                 name = self.__ASIDE_NAME
-        elif control_command in ("Decision", "decision"):
-            # is_command = False
-            name = "Dr."
-            for i in command.split(","):
-                if "option" in i:
-                    text += "".join(i.split("=")[1].strip(' "').split(";"))
-        elif control_command in ("Sticker", "Subtitle"):
+                if (
+                    self.__debug
+                    and (debug_info := f"no head: {head}") not in self.__unknown_heads
+                ):
+                    self.__unknown_heads.append(debug_info)
+            else:
+                name = head
+                if self.__debug and head not in self.__unknown_heads:
+                    self.__unknown_heads.append(head)
+        return True, name, text
+
+    def __parse_name(self, command: str, text: str) -> tuple[bool, str, str]:
+        name = self.__get_attribute(command)
+        if name == "":
             name = self.__ASIDE_NAME
-            for i in command.split(","):
-                if "text" in i:
-                    text += i.split("text=")[1].strip(' "')
-        elif control_command in ("narration", "Narration", "isAvatarRight"):
+        return False, name, text
+
+    def __parse_decision(self, command: str, text: str) -> tuple[bool, str, str]:
+        for i in command.split(","):
+            if "option" in i:
+                text += "".join(i.split("=")[1].strip(' "').split(";"))
+        return True, "Dr.", text
+
+    def __parse_sticker(self, command: str, text: str) -> tuple[bool, str, str]:
+        for i in command.split(","):
+            if "text" in i:
+                text += i.split("text=")[1].strip(' "')
+        return True, self.__ASIDE_NAME, text
+
+    def __parse_narration(self, command: str, text: str) -> tuple[bool, str, str]:
+        return True, self.__ASIDE_NAME, text
+
+    def __parse_multiline(self, command: str, text: str) -> tuple[bool, str, str]:
+        try:
+            name = self.__get_attribute(command)
+        except IndexError:
             name = self.__ASIDE_NAME
-        elif control_command in ("multiline"):
-            try:
-                name = get_attribute(command)
-            except IndexError:
-                name = self.__ASIDE_NAME
+        return True, name, text
+
+    def __parse_line(self, command: str, text: str) -> tuple[bool, str, list[str], str]:
+        # TODO: 使用立绘判断身份
+        handler = self.__get_handler(command)
+        if handler is None:
+            is_command, name = True, ""
         else:
-            name = ""
-            if self.__debug and control_command not in self.__unknown_commands:
-                # warnings.warn(f"unknwn command: {command}")
-                self.__unknown_commands.append(control_command)
-
-        match_set = set()
-        for i in self.__subtitle_pattern.finditer(text):
-            match_set.add(i.group())
-        for i in match_set:
-            # print(i, "|", text)
-            text = text.replace(i, " ")
-        # if len(match_set):
-        #     print(text, "\n")
-
-        words = []
-        clean_text = ""
-        endpos = 0
-        for i in self.__line_pattern.finditer(text):
-            word = i.group()
-            clean_text += text[endpos : i.start()]
-            endpos = i.end()
-            words.append(word)
-        clean_text += text[endpos:]
-        # 方舟特色倒了！狠狠打击水字数 ( ͡• ͜ʖ ͡• ) 标点符号数缩水 38.19%（逃
-        # 破案了！(＃°Д°) 原来省略号占了总标点符号数的 45.85%！（现已被削弱为⅛）
-        clean_text = clean_text.replace("...", "…").replace("……", "…")
-        clean_text = clean_text.replace("——", "—")
+            is_command, name, text = handler(command, text)
+        if text == "":
+            return is_command, name, [], ""
+
+        words, clean_text = self.__tokenize(text)
 
         if self.__debug and len(words):
+            text = self.__subtitle_pattern.sub(" ", text)
             print(words, command)
             print(text)
             print(clean_text)
@@ -184,39 +252,120 @@ def get_attribute(cmd_str: str):
                     f"\n>>> Debug >>>:\n{words} {command}\n{text}\n{temp}\n<<< Debug End <<<\n"
                 )
 
-        collection = collections.Counter(words)
-        collection.update(clean_text.replace(" ", ""))
-        return is_command, name, collection
+        return is_command, name, words, clean_text
 
-    def parse_story(self, story: dict):
-        command_count = 0
-        collection_dict: dict[str, collections.Counter] = {}
+    def __tokenize(self, text: str) -> tuple[list[str], str]:
+        """一次扫描得到单词与去除单词后的文本，字幕标记视为空格
 
+        Returns:
+            tuple[list[str], str]: 单词，以及去除单词并折叠省略号与破折号后的文本（含空格）
+        """
+        words: list[str] = []
+        parts: list[str] = []
+        # 单词两侧的点与破折号在去除单词后相连，须合在一起折叠
+        marks = ""
+        for word, subtitle, mark, other in self.__token_pattern.findall(text):
+            if word:
+                words.append(word)
+            elif mark:
+                marks += mark
+            else:
+                if marks:
+                    parts.append(self.__fold_marks(marks))
+                    marks = ""
+                parts.append(other or " ")
+        if marks:
+            parts.append(self.__fold_marks(marks))
+
+        return words, "".join(parts)
+
+    @staticmethod
+    def __fold_marks(marks: str) -> str:
+        # 方舟特色倒了！狠狠打击水字数 ( ͡• ͜ʖ ͡• ) 标点符号数缩水 38.19%（逃
+        # 破案了！(＃°Д°) 原来省略号占了总标点符号数的 45.85%！（现已被削弱为⅛）
+        return marks.replace("...", "…").replace("……", "…").replace("——", "—")
+
+    def __story_files(self, story: dict) -> tuple[StoryFile | None, ...]:
         if self.__count_info:
-            txts = story.values()
-        else:
-            txts = (story["txt"],)
-
-        for txt in txts:
-            for line in self.__text_pattern.finditer(txt):
-                if line.group() == "":
-                    continue
-                command, text = line.groups()
-                if command is None:
-                    command = f'name="{self.__ASIDE_NAME}"'
-                else:
-                    command = command.strip()
-                if text is None:
-                    text = ""
-                else:
-                    text = text.strip()
-                is_command, name, collection = self.__parse_line(command, text)
+            return (story["info"], story["txt"])
+        return (story["txt"],)
+
+    def parser_context(self) -> dict[str, dict]:
+        """解析剧情时用到的数据表（用于识别说话人）"""
+        return {"speaker_index": self.data["excel"]["speaker_index"]}
+
+    def parser_fingerprint(self) -> str:
+        """解析器指纹：解析逻辑版本、已知指令、是否统计简介、标点符号及解析时用到的数据表"""
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(
+            json.dumps(
+                [
+                    self.__VERSION,
+                    self.__known_commands,
+                    self.__count_info,
+                    sorted(self.punctuation),
+                ],
+                ensure_ascii=False,
+            ).encode()
+        )
+        for table in self.parser_context().values():
+            hasher.update(json.dumps(table, ensure_ascii=False).encode())
+        return hasher.hexdigest()
+
+    def story_digest(self, story: dict, fingerprint: str) -> str:
+        """剧情的解析结果缓存键：待解析文件的内容哈希与解析器指纹的组合"""
+        hasher = hashlib.blake2b(fingerprint.encode(), digest_size=16)
+        for story_file in self.__story_files(story):
+            hasher.update(b"" if story_file is None else story_file[1].encode())
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def read_script(self, lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+        """逐行读取剧情脚本
+
+        `[command]text` 形式的行以最后一个 `]` 分隔指令与文本；没有指令的行视为旁白；跳过空行。
+
+        Args:
+            lines (Iterable[str]): 剧情文本的各行，可以是打开的文本文件
+
+        Yields:
+            Iterator[tuple[str, str]]: (command, text)
+        """
+        for line in lines:
+            line = line.removesuffix("\n")
+            if line == "":
+                continue
+            end = line.rfind("]")
+            if line.startswith("[") and end > 1:
+                yield line[1:end].strip(), line[end + 1 :].strip()
+            else:
+                yield f'name="{self.__ASIDE_NAME}"', line.strip()
+
+    def parse_story(self, story: dict) -> tuple[int, dict[str, SpeakerTally]]:
+        """解析剧情，逐行累加到各说话人名下
+
+        Returns:
+            tuple[int, dict[str, SpeakerTally]]: 指令数，以及按首次出现的顺序排列的各说话人的统计
+        """
+        command_count = 0
+        # 各说话人的单词数与去除单词后的文本
+        word_counts: dict[str, int] = {}
+        texts: dict[str, list[str]] = {}
+
+        for story_file in self.__story_files(story):
+            for command, text in self.read_script(self.__store.lines(story_file)):
+                is_command, name, words, clean_text = self.__parse_line(command, text)
                 if is_command:
                     command_count += 1
-                if collection.total() > 0:
-                    if name in collection_dict:
-                        collection_dict[name].update(collection)
+                if words or len(clean_text) > clean_text.count(" "):
+                    if name in texts:
+                        word_counts[name] += len(words)
+                        texts[name].append(clean_text)
                     else:
-                        collection_dict[name] = collection
+                        word_counts[name] = len(words)
+                        texts[name] = [clean_text]
 
-        return command_count, collection_dict
+        return command_count, {
+            name: self.__tally(word_counts[name], "".join(text_list))
+            for name, text_list in texts.items()
+        }
@@ -0,0 +1,67 @@
+import warnings
+
+# 说话人索引：{head: 说话人名称}，另以 `$变量名` 为键记录 story_variables 中变量所指的 head
+SpeakerIndex = dict[str, str]
+
+# 档案中没有该干员时的说话人名称
+_SPECIAL_SPEAKERS: dict[str, str] = {
+    "char_340_shwazr6": "黑",
+}
+
+
+def build_speaker_index(
+    story_variables: dict[str, str], handbook_info_table: dict[str, dict]
+) -> SpeakerIndex:
+    """由 `story_variables` 与 `handbook_info_table` 建立说话人索引，只在更新时建立一次
+
+    Args:
+        story_variables (dict[str, str]): 剧情变量，`PopupDialog(dialogHead="$变量名")` 由此得到 head
+        handbook_info_table (dict[str, dict]): 干员档案，其首条档案的第一行为 `【代号】干员名`
+
+    Returns:
+        SpeakerIndex: 说话人索引
+    """
+    speaker_index: SpeakerIndex = {}
+    for head, handbook in handbook_info_table.get("handbookDict", {}).items():
+        try:
+            story_text: str = handbook["storyTextAudio"][0]["stories"][0]["storyText"]
+        except LookupError:
+            continue
+        speaker_index[head] = story_text.split("\n")[0].replace("【代号】", "")
+
+    for head, name in _SPECIAL_SPEAKERS.items():
+        speaker_index.setdefault(head, name)
+
+    for variable, head in story_variables.items():
+        if isinstance(head, str):
+            speaker_index[f"${variable}"] = head
+
+    return speaker_index
+
+
+class SpeakerResolver:
+    """在说话人索引中查找 head，每个找不到的 head 只警告一次"""
+
+    def __init__(self, speaker_index: SpeakerIndex):
+        self.__speaker_index = speaker_index
+        self.__missing: set[str] = set()
+
+    def __warn(self, head: str):
+        if head not in self.__missing:
+            self.__missing.add(head)
+            warnings.warn(f"not found {head}")
+
+    def variable(self, head: str) -> str | None:
+        """`$变量名` 所指的 head，找不到时为 None"""
+        resolved = self.__speaker_index.get(f"${head.lstrip('$')}")
+        if resolved is None:
+            self.__warn(head)
+        return resolved
+
+    def name(self, head: str) -> str:
+        """干员 head 对应的说话人名称，找不到时即为 head 本身"""
+        name = self.__speaker_index.get(head)
+        if name is None:
+            self.__warn(head)
+            return head
+        return name
@@ -0,0 +1,55 @@
+import hashlib
+from pathlib import Path
+from typing import Iterator
+
+# 剧情文件：(相对于 story 目录的路径, 内容哈希)
+StoryFile = tuple[str, str]
+
+
+class StoryChangedError(RuntimeError):
+    """剧情文件的内容与更新时记录的内容哈希不符"""
+
+    def __init__(self, path: str):
+        # 只以 path 作为参数，以便在进程间传递
+        super().__init__(path)
+        self.path = path
+
+    def __str__(self) -> str:
+        return f"{self.path} has changed since last update, please update (-u) again!"
+
+
+class StoryStore:
+    """按需读取剧情文本
+
+    `data["story"]` 中每个剧情只保存其 info 与 txt 文件的 `StoryFile`，
+    解析时才从 story 目录中逐行读取文本，不再将全部剧情文本常驻内存并写入缓存。
+    """
+
+    def __init__(self, story_dir: Path):
+        self.story_dir = story_dir
+
+    @staticmethod
+    def digest(content: bytes) -> str:
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    def lines(self, story_file: StoryFile | None) -> Iterator[str]:
+        """逐行读取剧情文本，不必将整个文件读入内存
+
+        与以文本模式读取时一样，`\\r\\n` 与 `\\r` 均视为换行；读完后校验内容哈希。
+
+        Raises:
+            StoryChangedError: 内容哈希不符，此时解析结果不对应解析缓存键，不能使用
+        """
+        if story_file is None:
+            return
+
+        path, digest = story_file
+        hasher = hashlib.blake2b(digest_size=16)
+        with (self.story_dir / path).open("rb") as file:
+            for line in file:
+                hasher.update(line)
+                yield from (
+                    line.decode().replace("\r\n", "\n").replace("\r", "\n").split("\n")
+                )
+        if hasher.hexdigest() != digest:
+            raise StoryChangedError(path)
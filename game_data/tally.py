@@ -0,0 +1,57 @@
+import collections
+import sys
+import warnings
+from typing import Callable
+
+# 说话人的统计：{"words": 字数, "punctuation": 标点符号数, "ellipsis": 省略号数}
+SpeakerTally = dict[str, int]
+# 由说话人的单词数与去除单词后的文本（含空格）得到其统计
+Tally = Callable[[int, str], SpeakerTally]
+
+
+class CounterTally:
+    """以 `collections.Counter` 统计各字符"""
+
+    def __init__(self, punctuation: frozenset[str]):
+        self.__punctuation = punctuation
+
+    def __call__(self, word_count: int, text: str) -> SpeakerTally:
+        chars = collections.Counter(text)
+        del chars[" "]
+        punctuation = sum(chars[i] for i in self.__punctuation.intersection(chars))
+        return {
+            "words": word_count + chars.total() - punctuation,
+            "punctuation": punctuation,
+            "ellipsis": chars["…"],
+        }
+
+
+class NumpyTally:
+    """将文本转为 `uint32` 码位数组，以预先算好的标点符号码位掩码向量化统计"""
+
+    def __init__(self, punctuation: frozenset[str]):
+        import numpy as np
+
+        self.__np = np
+        self.__is_punctuation = np.zeros(sys.maxunicode + 1, dtype=np.bool_)
+        self.__is_punctuation[[ord(i) for i in punctuation]] = True
+
+    def __call__(self, word_count: int, text: str) -> SpeakerTally:
+        np = self.__np
+        code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        chars = code_points.size - int(np.count_nonzero(code_points == ord(" ")))
+        punctuation = int(np.count_nonzero(self.__is_punctuation[code_points]))
+        return {
+            "words": word_count + chars - punctuation,
+            "punctuation": punctuation,
+            "ellipsis": int(np.count_nonzero(code_points == ord("…"))),
+        }
+
+
+def get_tally(punctuation: frozenset[str], use_numpy: bool = False) -> Tally:
+    if use_numpy:
+        try:
+            return NumpyTally(punctuation)
+        except ImportError:
+            warnings.warn("numpy not found, counting characters with Counter instead.")
+    return CounterTally(punctuation)
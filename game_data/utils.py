@@ -1,28 +1,34 @@
+from __future__ import annotations
+
+import heapq
 import warnings
-from dataclasses import dataclass
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from tqdm import tqdm
 
 
-@dataclass(init=False, repr=False, frozen=True)
-class Axis:
+class Axis(tuple[int, int]):
     """数轴范围端点，闭区间 `[left, right]`"""
 
-    left: int
-    right: int
+    __slots__ = ()
 
-    def __init__(self, left: int, right: Optional[int] = None) -> None:
+    def __new__(cls, left: int, right: Optional[int] = None) -> "Axis":
         if right is None:
             right = left
 
         if left > right:
             raise ValueError(f"Invalid left > right in axis: {left} > {right}!")
 
-        object.__setattr__(self, "left", left)
-        object.__setattr__(self, "right", right)
+        return super().__new__(cls, (left, right))
 
-    def __iter__(self):
-        for index in (self.left, self.right):
-            yield index
+    @property
+    def left(self) -> int:
+        return self[0]
+
+    @property
+    def right(self) -> int:
+        return self[1]
 
     def __repr__(self) -> str:
         return f"[{self.left}, {self.right}]"
@@ -96,3 +102,75 @@ def merge_sheets_list(
         for bar in sheet_list[len(sheet) :]:
             bar.extend(content_bar)
     return sheet_list
+
+
+class BlockLayout:
+    """由多个子表拼成的表单数据，各子表放在各自的 (行, 列) 偏移处
+
+    与 `amend_sheet_list`、`merge_sheets_list` 不同，不以 None 填充为矩形，也不复制子表的数据。
+    子表为行的列表（各行可以不等长）或另一个 `BlockLayout`。
+    """
+
+    def __init__(self):
+        self.__blocks: list[tuple[int, int, list[list[Any]] | BlockLayout]] = []
+        # 相当于填充为矩形后的行数与列数
+        self.height = 0
+        self.width = 0
+
+    def place(self, block: list[list[Any]] | BlockLayout, row: int, col: int):
+        if isinstance(block, BlockLayout):
+            height, width = block.height, block.width
+        else:
+            height, width = len(block), max((len(bar) for bar in block), default=0)
+        self.__blocks.append((row, col, block))
+        self.height = max(self.height, row + height)
+        self.width = max(self.width, col + width)
+
+    def add_below(self, block: list[list[Any]] | BlockLayout):
+        """放在已有子表的下方，左对齐"""
+        self.place(block, self.height, 0)
+
+    def add_right(self, block: list[list[Any]] | BlockLayout):
+        """放在已有子表的右侧，顶端对齐"""
+        self.place(block, 0, self.width)
+
+    def cells(self, row: int = 0, col: int = 0) -> Iterator[tuple[int, int, Any]]:
+        """按先行后列的顺序逐个产生非空单元格 `(行, 列, 数据)`"""
+        iterators: list[Iterator[tuple[int, int, Any]]] = []
+        for block_row, block_col, block in self.__blocks:
+            if isinstance(block, BlockLayout):
+                iterators.append(block.cells(row + block_row, col + block_col))
+            else:
+                iterators.append(
+                    self.__list_cells(block, row + block_row, col + block_col)
+                )
+        return heapq.merge(*iterators, key=lambda cell: (cell[0], cell[1]))
+
+    @staticmethod
+    def __list_cells(
+        block: list[list[Any]], row: int, col: int
+    ) -> Iterator[tuple[int, int, Any]]:
+        for i, bar in enumerate(block):
+            for j, data in enumerate(bar):
+                if data is not None:
+                    yield row + i, col + j, data
+
+
+def thread_map[T, R](
+    func: Callable[[T], R], items: Sequence[T], desc: Optional[str] = None
+) -> list[R]:
+    """在线程池中并发执行以 I/O 为主的 `func`
+
+    Args:
+        func (Callable[[T], R]): 要执行的函数
+        items (Sequence[T]): 每次执行的参数
+        desc (Optional[str], optional): 进度条的描述，为 `None` 时不显示进度条. Defaults to None.
+
+    Returns:
+        list[R]: 按 `items` 的顺序返回的执行结果
+    """
+    with ThreadPoolExecutor() as executor:
+        results = executor.map(func, items)
+        if desc is not None:
+            results = tqdm(results, desc, total=len(items))
+        return list(results)
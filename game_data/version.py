@@ -0,0 +1,83 @@
+"""数据版本探测
+
+只读取 `data_version.txt`、缓存的版本文件与已发布的 json 文件，不加载任何缓存数据，
+也不导入 tqdm、PIL 等较重的依赖，供 `--test_update` 快速判断是否需要更新。
+"""
+
+import json
+from argparse import Namespace
+from pathlib import Path
+
+# 缓存格式版本，缓存的内容或结构有变动（如新增说话人索引、统计结果改为事实表）时递增
+CACHE_FORMAT_VERSION = 1
+
+
+def parse_version(ver: str) -> tuple[int, ...]:
+    return tuple(int(x) for x in ver.split("."))
+
+
+def format_version(version: tuple[int, ...]) -> str:
+    return ".".join(str(x) for x in version)
+
+
+def read_data_version(data_version_path: Path) -> tuple[int, ...]:
+    """读取游戏数据目录中 `excel/data_version.txt` 的数据版本"""
+    if not data_version_path.exists():
+        raise FileNotFoundError(f"{data_version_path.absolute()} not found!")
+
+    content = data_version_path.read_text(encoding="utf-8")
+    return parse_version(content.split(":")[-1].strip())
+
+
+def read_cached_version(version_file: Path) -> tuple[tuple[int, ...], int]:
+    """读取缓存数据所对应的数据版本与缓存格式版本
+
+    版本文件不存在时为 `0.0.0`，未记录缓存格式版本（旧版版本文件）时为 0。
+    """
+    if not version_file.exists():
+        return (0, 0, 0), 0
+    lines = version_file.read_text(encoding="utf-8").split()
+    return parse_version(lines[0]), int(lines[1]) if len(lines) > 1 else 0
+
+
+def write_cached_version(version_file: Path, version: tuple[int, ...]):
+    version_file.write_text(
+        f"{format_version(version)}\n{CACHE_FORMAT_VERSION}\n", encoding="utf-8"
+    )
+
+
+def read_published_version(json_file: Path) -> tuple[int, ...]:
+    """读取已发布的 json 文件中的数据版本"""
+    if not json_file.exists():
+        return (0, 0, 0)
+    json_data = json.loads(json_file.read_text(encoding="utf-8"))
+    return parse_version(json_data["info"]["data"]["数据版本"])
+
+
+class VersionProbe:
+    """只比较数据版本与缓存格式版本，判断游戏数据目录是否需要更新"""
+
+    def __init__(self, data_dir_path: str, config: Namespace):
+        self.data_dir = Path(data_dir_path)
+        if not self.data_dir.is_dir():
+            raise NotADirectoryError(f"{self.data_dir.absolute()} is not a directory!")
+
+        self.version = read_data_version(self.data_dir / "excel" / "data_version.txt")
+        self.__version_file = Path(config.version_file_path)
+        self.__json_file = Path(config.json_file_path)
+        self.__cache_files = (
+            Path(config.pickle_file_path),
+            Path(config.sqlite_file_path),
+        )
+
+    @property
+    def need_update(self) -> bool:
+        cached_version, cache_format = read_cached_version(self.__version_file)
+        # 已有的缓存为旧格式（包括没有版本文件的旧版缓存），须重新更新以迁移缓存
+        if cache_format != CACHE_FORMAT_VERSION and any(
+            file.exists() for file in self.__cache_files
+        ):
+            return True
+        return self.version > max(
+            cached_version, read_published_version(self.__json_file)
+        )
@@ -1,25 +1,49 @@
+from typing import TYPE_CHECKING
+
 from config import Config
-from game_data import GameData
+from game_data import VersionProbe
 
+if TYPE_CHECKING:
+    from game_data import GameData
 
-def manipulate(game: GameData):
-    from datetime import datetime, timedelta, timezone
 
-    print("Current GameData Dir:", game.data_dir)
+def select_data_dir(data_dir_set: set[str]) -> VersionProbe:
+    """只比较数据版本，选出需要更新的数据目录，不加载缓存数据，也不导入统计与导出所需的依赖"""
+    probes: list[VersionProbe] = []
+    for data_dir in data_dir_set:
+        try:
+            probes.append(VersionProbe(data_dir, Config.game_data_config))
+        except NotADirectoryError as e:
+            print(f"{data_dir} 数据目录不存在或无法读取: {e}")
+            continue
+    probes.reverse()
+    for probe in probes:
+        if probe.need_update:
+            break
+    else:
+        probe = probes[-1]
 
-    # Used by GitHub Actions
-    if args.test_update:
-        import os
+    return probe
 
-        # 设置环境变量以供 GitHub Actions 捕获
-        # 如果是手动执行，则会强制更新：need_update = github.event_name != 'schedule' || test_update
-        with open(os.environ["GITHUB_OUTPUT"], "a") as github_output:
-            print(
-                f"test_update={str(game.need_update).lower()}",
-                file=github_output,
-            )
 
-        return
+def check_update(probe: VersionProbe):
+    import os
+
+    print("Current GameData Dir:", probe.data_dir)
+
+    # 设置环境变量以供 GitHub Actions 捕获
+    # 如果是手动执行，则会强制更新：need_update = github.event_name != 'schedule' || test_update
+    with open(os.environ["GITHUB_OUTPUT"], "a") as github_output:
+        print(
+            f"test_update={str(probe.need_update).lower()}",
+            file=github_output,
+        )
+
+
+def manipulate(game: "GameData"):
+    from datetime import datetime, timedelta, timezone
+
+    print("Current GameData Dir:", game.data_dir)
 
     datetime_now = datetime.now(timezone(timedelta(hours=8)))
     game.data["info"] = {
@@ -69,29 +93,24 @@ def main():
     if args.all:
         data_dir_set.update({*Config.DATA_DIRS})
 
-    game_data_objs: list[GameData] = []
-    for data_dir in data_dir_set:
-        try:
-            game_data_objs.append(
-                GameData(
-                    data_dir_path=data_dir,
-                    config=Config.game_data_config,
-                    count_config=Config.count_config,
-                    dump_config=Config.dump_config,
-                    args=args,
-                )
-            )
-        except NotADirectoryError as e:
-            print(f"{data_dir} 数据目录不存在或无法读取: {e}")
-            continue
-    game_data_objs.reverse()
-    for game_data in game_data_objs:
-        if game_data.need_update:
-            break
-    else:
-        game_data = game_data_objs[-1]
+    probe = select_data_dir(data_dir_set)
+
+    # Used by GitHub Actions
+    if args.test_update:
+        check_update(probe)
+        return
+
+    from game_data import GameData
 
-    manipulate(game_data)
+    # 只构造被选中的数据目录，其缓存数据在首次访问时才加载
+    with GameData(
+        data_dir_path=str(probe.data_dir),
+        config=Config.game_data_config,
+        count_config=Config.count_config,
+        dump_config=Config.dump_config,
+        args=args,
+    ) as game_data:
+        manipulate(game_data)
 
 
 if __name__ == "__main__":
@@ -170,6 +189,29 @@ def main():
         action="store_true",
         help="Do not dump data.",
     )
+    switch.add_argument(
+        "--sqlite",
+        action="store_true",
+        help="Using SQLite cache instead of pickle file.",
+    )
+    switch.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Parsing stories in N processes (0 for all CPUs, ignored with --debug).",
+    )
+    switch.add_argument(
+        "--numpy",
+        action="store_true",
+        help="Counting characters with NumPy (numpy must be installed).",
+    )
+    switch.add_argument(
+        "--fast_layout",
+        action="store_true",
+        help="Estimating column widths & row heights without font files.",
+    )
 
     parser.usage = "python %(prog)s [-h] [-v] [{options_title}] [data_dir]".format(
         options_title=switch.title